@@ -0,0 +1,55 @@
+"""
+Numba로 컴파일한 로컬 토큰 중복도 채점 커널 (ROUGE-L)
+
+토큰을 공유 vocab으로 int32 배열로 인코딩한 뒤, LCS(최장 공통 부분열) DP를 1차원 롤링 배열로 계산합니다.
+파이썬 이중 루프로 수십 ms 걸리는 긴 응답도 마이크로초 단위로 처리되며,
+JIT 컴파일은 모듈 import 시 한 번만 수행(cache=True로 디스크에 캐시)하여 첫 문항 지연을 막습니다.
+
+LLM Judge를 대체하지 않는 진단용 지표로, 가중 총점에는 포함되지 않습니다.
+"""
+import re
+
+import numpy as np
+from numba import njit
+
+_TOKEN_RE = re.compile(r"\w+")
+
+# 모든 문항이 공유하는 토큰 → 정수 ID 사전
+_VOCAB: dict = {}
+
+def _encode(text: str) -> np.ndarray:
+    tokens = _TOKEN_RE.findall((text or "").lower())
+    return np.fromiter((_VOCAB.setdefault(token, len(_VOCAB)) for token in tokens), dtype=np.int32, count=len(tokens))
+
+@njit(cache=True)
+def rouge_l_lcs(a, b) -> float:
+    """두 int32 토큰 배열(a: 정답, b: 응답)의 ROUGE-L F1 점수"""
+    n, m = a.size, b.size
+    if n == 0 or m == 0:
+        return 0.0
+
+    # row[j + 1] = 현재까지 처리한 a[:i]와 b[:j + 1]의 LCS 길이
+    row = np.zeros(m + 1, dtype=np.int32)
+    for i in range(n):
+        diag = 0
+        for j in range(m):
+            up = row[j + 1]
+            if a[i] == b[j]:
+                row[j + 1] = diag + 1
+            elif row[j] > up:
+                row[j + 1] = row[j]
+            diag = up
+
+    lcs = row[m]
+    if lcs == 0:
+        return 0.0
+    precision = lcs / m
+    recall = lcs / n
+    return 2 * precision * recall / (precision + recall)
+
+def rouge_l(reference: str, candidate: str) -> float:
+    """정답(reference)과 응답(candidate)의 ROUGE-L F1 (0~1)"""
+    return float(rouge_l_lcs(_encode(reference), _encode(candidate)))
+
+# import 시점에 JIT 컴파일 (첫 문항 채점 시간에 컴파일 비용이 섞이지 않도록)
+rouge_l_lcs(np.zeros(1, dtype=np.int32), np.zeros(1, dtype=np.int32))
@@ -0,0 +1,99 @@
+"""
+로컬 임베딩 기반 평가 지표 (Clarity, Atomicity)
+
+명확성/원자성은 정답이나 컨텍스트 없이 응답 텍스트와 질문만으로 판단할 수 있으므로,
+LLM Judge 호출 대신 문장 임베딩 + 휴리스틱으로 로컬에서 채점합니다.
+- clarity: 인접 문장 간 임베딩 코사인 거리의 분산이 클수록(주제가 오락가락할수록) 낮은 점수
+- atomicity: 질문과 관련성이 낮은(부차적인) 문장이 많을수록 낮은 점수 (1 / (1 + 부차 문장 수))
+
+GEval 메트릭과 동일한 인터페이스(name, criteria, evaluation_params, score, reason, measure/a_measure)를 제공하므로
+가중치 합산 로직은 그대로 사용할 수 있습니다.
+"""
+import os
+import re
+import asyncio
+from abc import ABC, abstractmethod
+
+import numpy as np
+from deepeval.test_case import LLMTestCaseParams
+from sentence_transformers import SentenceTransformer
+
+# 평가 데이터가 한국어이므로 다국어 MiniLM 모델을 기본값으로 사용
+EMBED_MODEL_NAME = os.getenv("EVAL_EMBED_MODEL", "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2")
+
+# 질문과의 코사인 유사도가 이 값보다 낮은 문장은 부차적인(요청하지 않은) 내용으로 간주
+OFF_TOPIC_THRESHOLD = 0.3
+
+# 모듈 import 시 한 번만 로드 (문항마다 재로드 방지)
+embedder = SentenceTransformer(EMBED_MODEL_NAME)
+
+_SENTENCE_SPLIT_RE = re.compile(r"(?<=[.!?。])\s+|\n+")
+
+def _split_sentences(text: str) -> list:
+    # 마크다운 목록 기호/강조 표시를 제거하고 빈 문장은 제외
+    sentences = (s.strip(" \t-*•#") for s in _SENTENCE_SPLIT_RE.split(text))
+    return [s for s in sentences if s]
+
+def clarity_score(answer: str) -> float:
+    """인접 문장 간 코사인 거리의 분산을 [0, 1]로 정규화하여 1에서 뺀 값"""
+    sentences = _split_sentences(answer)
+    if len(sentences) < 3:
+        return 1.0
+
+    emb = embedder.encode(sentences, normalize_embeddings=True)
+    distances = 1.0 - np.sum(emb[:-1] * emb[1:], axis=1)
+    # [0, 1] 구간 값의 분산 최댓값(0.25)으로 정규화
+    return float(1.0 - min(1.0, np.var(distances) / 0.25))
+
+def atomicity_score(question: str, answer: str) -> float:
+    """질문과 관련성이 낮은 문장 수를 세어 1 / (1 + 부차 문장 수)로 환산"""
+    sentences = _split_sentences(answer)
+    if not sentences:
+        return 0.0
+
+    emb = embedder.encode([question] + sentences, normalize_embeddings=True)
+    similarities = emb[1:] @ emb[0]
+    off_topic = int(np.sum(similarities < OFF_TOPIC_THRESHOLD))
+    return 1.0 / (1 + off_topic)
+
+class LocalMetric(ABC):
+    """GEval과 같은 방식으로 사용할 수 있는 로컬 채점 메트릭의 공통 인터페이스"""
+    name = ""
+    criteria = ""
+    evaluation_params = [LLMTestCaseParams.INPUT, LLMTestCaseParams.ACTUAL_OUTPUT]
+
+    def __init__(self):
+        self.score = None
+        self.reason = None
+
+    @abstractmethod
+    def _score(self, test_case) -> float:
+        ...
+
+    def evaluate(self, test_case) -> tuple[float, str]:
+        """(점수, 사유)를 반환합니다. 인스턴스 속성을 바꾸지 않으므로 여러 문항을 동시에(여러 스레드에서) 채점할 수 있습니다."""
+        score = self._score(test_case)
+        return score, f"{self.criteria} (local score: {score:.2f})"
+
+    def measure(self, test_case) -> float:
+        self.score, self.reason = self.evaluate(test_case)
+        return self.score
+
+    async def a_measure(self, test_case) -> float:
+        # 임베딩 계산은 CPU 연산이므로 이벤트 루프를 막지 않도록 스레드에서 실행
+        self.score, self.reason = await asyncio.to_thread(self.evaluate, test_case)
+        return self.score
+
+class LocalClarityMetric(LocalMetric):
+    name = "Clarity and Specificity (Local)"
+    criteria = "Variance of embedding distances between adjacent sentences; rambling answers score low."
+
+    def _score(self, test_case) -> float:
+        return clarity_score(test_case.actual_output)
+
+class LocalAtomicityMetric(LocalMetric):
+    name = "Atomicity (Local)"
+    criteria = f"Number of answer sentences with cosine similarity below {OFF_TOPIC_THRESHOLD} to the question."
+
+    def _score(self, test_case) -> float:
+        return atomicity_score(test_case.input, test_case.actual_output)
@@ -0,0 +1,64 @@
+"""
+평가 파이프라인 디스크 캐시 (SQLite)
+
+- 에이전트 응답: sha256(AGENT_VERSION|question) 키로 저장하여 재실행 시 에이전트 재호출을 생략합니다.
+  에이전트(프롬프트, 도구, 모델)가 바뀌면 AGENT_VERSION 환경변수를 올려야 이전 응답이 재사용되지 않습니다.
+- 메트릭 점수: (테스트 케이스 해시, 메트릭 이름, criteria 해시) 키로 저장하여
+  응답이나 채점 기준(criteria)이 바뀐 경우에만 Judge를 다시 호출합니다.
+"""
+import os
+import time
+import sqlite3
+import hashlib
+from typing import Optional
+
+CACHE_PATH = os.getenv("EVAL_CACHE_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".eval_cache.sqlite3"))
+AGENT_VERSION = os.getenv("AGENT_VERSION", "v1")
+
+_conn: Optional[sqlite3.Connection] = None
+
+def _get_conn() -> sqlite3.Connection:
+    global _conn
+    if _conn is None:
+        _conn = sqlite3.connect(CACHE_PATH)
+        _conn.execute("CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, question TEXT, answer TEXT, ts REAL)")
+        _conn.execute("CREATE TABLE IF NOT EXISTS metric_cache (key TEXT PRIMARY KEY, metric TEXT, score REAL, reason TEXT, ts REAL)")
+        _conn.commit()
+    return _conn
+
+def _sha256(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+def get_answer(question: str) -> Optional[str]:
+    """캐시된 에이전트 응답을 반환합니다. (없으면 None)"""
+    key = _sha256(f"{AGENT_VERSION}|{question}")
+    row = _get_conn().execute("SELECT answer FROM cache WHERE key=?", (key,)).fetchone()
+    return row[0] if row else None
+
+def set_answer(question: str, answer: str):
+    key = _sha256(f"{AGENT_VERSION}|{question}")
+    conn = _get_conn()
+    conn.execute("INSERT OR REPLACE INTO cache VALUES (?, ?, ?, ?)", (key, question, answer, time.time()))
+    conn.commit()
+
+def _metric_key(test_case, metric_name: str, criteria: str) -> str:
+    response_hash = _sha256("|".join([
+        test_case.input,
+        test_case.actual_output,
+        test_case.expected_output or "",
+        "\n".join(test_case.retrieval_context or []),
+    ]))
+    return _sha256(f"{response_hash}|{metric_name}|{_sha256(criteria)}")
+
+def get_metric_score(test_case, metric_name: str, criteria: str) -> Optional[tuple[float, str]]:
+    """캐시된 (점수, 사유)를 반환합니다. (없으면 None)"""
+    row = _get_conn().execute("SELECT score, reason FROM metric_cache WHERE key=?", (_metric_key(test_case, metric_name, criteria),)).fetchone()
+    return (row[0], row[1]) if row else None
+
+def set_metric_score(test_case, metric_name: str, criteria: str, score: float, reason: str):
+    conn = _get_conn()
+    conn.execute(
+        "INSERT OR REPLACE INTO metric_cache VALUES (?, ?, ?, ?, ?)",
+        (_metric_key(test_case, metric_name, criteria), metric_name, score, reason, time.time())
+    )
+    conn.commit()
@@ -1,4 +1,9 @@
 import os
+import textwrap
+from typing import Optional
+
+import httpx
+import numpy as np
 from dotenv import load_dotenv, find_dotenv
 
 # .env 파일 로드
@@ -8,26 +13,82 @@ from deepeval.metrics import GEval
 from deepeval.test_case import LLMTestCaseParams
 from deepeval.models import DeepEvalBaseLLM
 from langchain_google_genai import ChatGoogleGenerativeAI
+from langchain_core.messages import SystemMessage, HumanMessage
+from pydantic import BaseModel, Field, create_model
+from google import genai
+
+# Judge 요청 타임아웃 (google-genai는 요청마다 타임아웃을 지정하므로 httpx 클라이언트가 아닌 HttpOptions에 설정)
+JUDGE_TIMEOUT_SECONDS = 60
+
+# 모든 Judge 인스턴스가 공유하는 HTTP/2 비동기 연결 풀
+# 동시에 나가는 채점 요청을 하나의 연결로 멀티플렉싱하여 요청마다 TCP/TLS 핸드셰이크가 반복되지 않도록 함
+http_async_client = httpx.AsyncClient(
+    http2=True,
+    limits=httpx.Limits(max_connections=20, max_keepalive_connections=20)
+)
+
+def _with_http_options(client: genai.Client, **options) -> genai.Client:
+    """
+    google-genai 클라이언트를 기존 http_options(base_url, client_args, 헤더 등)에 options만 덮어쓴 클라이언트로 교체합니다.
+    인증은 기존 클라이언트가 확정한 값(API 키 또는 Vertex AI 자격 증명/ADC)을 그대로 사용합니다.
+    """
+    api_client = client._api_client
+    http_options = api_client._http_options.model_copy(update=options)
+    if api_client.api_key:
+        auth = {"api_key": api_client.api_key}
+    else:
+        auth = {"credentials": api_client._credentials, "project": api_client.project, "location": api_client.location}
+    replaced = genai.Client(vertexai=api_client.vertexai, http_options=http_options, **auth)
+    # 기존 클라이언트의 동기 연결 풀을 닫음 (비동기 풀은 요청 전이라 열린 연결이 없음)
+    client.close()
+    return replaced
 
 class GoogleGemini(DeepEvalBaseLLM):
-    def __init__(self, model_name="gemini-2.5-flash"):
+    def __init__(self, model_name="gemini-2.5-flash", service_tier: str = "standard", system_instructions: Optional[str] = None):
+        """
+        service_tier: Gemini 추론 티어
+        - "standard": 기본 티어
+        - "priority": 대화형 로컬 평가용 (호출 지연 최소화, 단가 높음)
+        - "flex": 야간 무인 평가용 (지연 허용, 50% 비용 절감)
+
+        system_instructions: 모든 호출에 공통으로 들어가는 정적 지시문(채점 기준 등).
+        매 호출의 맨 앞(system instruction)에 같은 내용으로 붙여, 프롬프트 접두부가 커지면 Gemini 암묵적 캐싱이 적용되도록 합니다.
+        (현재 채점 기준은 명시적 컨텍스트 캐시의 최소 크기(1,024 토큰)에 못 미쳐 별도 캐시를 만들지 않습니다.)
+        """
         api_key = os.getenv("EVAL_GEMINI_API_KEY") or os.getenv("GOOGLE_API_KEY")
+        self.model_name = model_name
+        self.service_tier = service_tier
         self.model = ChatGoogleGenerativeAI(model=model_name, api_key=api_key)
+        # langchain_google_genai는 티어 옵션과 httpx 클라이언트 주입을 노출하지 않으므로,
+        # 모델이 구성한 google-genai 클라이언트의 설정 위에 공유 연결 풀/타임아웃/티어만 얹은 클라이언트로 교체
+        self.model.client = _with_http_options(
+            self.model.client,
+            extra_body={"service_tier": service_tier} if service_tier != "standard" else None,
+            timeout=JUDGE_TIMEOUT_SECONDS * 1000,
+            httpx_async_client=http_async_client
+        )
+
+        self.system_instructions = system_instructions
+
+    def _messages(self, prompt: str):
+        if not self.system_instructions:
+            return prompt
+        return [SystemMessage(content=self.system_instructions), HumanMessage(content=prompt)]
         
     def load_model(self):
         return self.model
         
     def generate(self, prompt: str) -> str:
-        return self.model.invoke(prompt).content
+        return self.model.invoke(self._messages(prompt)).content
         
     async def a_generate(self, prompt: str) -> str:
-        res = await self.model.ainvoke(prompt)
+        res = await self.model.ainvoke(self._messages(prompt))
         return res.content
         
     def get_model_name(self):
         return "Google Gemini"
 
-gemini_model = GoogleGemini()
+gemini_model = GoogleGemini(service_tier=os.getenv("GEMINI_TIER", "standard"))
 
 # 1. 정합성/근거성 (Groundedness + Context Limitation) - 가중치 25
 groundedness_metric = GEval(
@@ -89,6 +150,140 @@ robustness_metric = GEval(
     evaluation_params=[LLMTestCaseParams.INPUT, LLMTestCaseParams.ACTUAL_OUTPUT, LLMTestCaseParams.EXPECTED_OUTPUT],
 )
 
+# 명확성/원자성은 정답/컨텍스트 없이 응답 텍스트만으로 판단 가능하므로 기본적으로 로컬 임베딩 지표로 채점
+# (EVAL_LOCAL_STYLE_METRICS=0 이면 LLM Judge로 채점, A/B 보정용)
+USE_LOCAL_STYLE_METRICS = os.getenv("EVAL_LOCAL_STYLE_METRICS", "1") == "1"
+
+if USE_LOCAL_STYLE_METRICS:
+    from _local_metrics import LocalClarityMetric, LocalAtomicityMetric
+    clarity_metric = LocalClarityMetric()
+    atomicity_metric = LocalAtomicityMetric()
+
+# 메트릭 키 → 메트릭 / 문항 단위 가중치 (합계 65)
+METRICS = {
+    "groundedness": groundedness_metric,
+    "evidenceability": evidenceability_metric,
+    "clarity": clarity_metric,
+    "atomicity": atomicity_metric,
+    "robustness": robustness_metric,
+}
+
+# LLM Judge 호출이 필요한 메트릭 / API 호출 없이 로컬에서 계산되는 메트릭
+JUDGE_METRICS = {name: metric for name, metric in METRICS.items() if isinstance(metric, GEval)}
+LOCAL_METRICS = {name: metric for name, metric in METRICS.items() if not isinstance(metric, GEval)}
+
+METRIC_WEIGHTS = {
+    "groundedness": 25,
+    "evidenceability": 15,
+    "clarity": 10,
+    "atomicity": 10,
+    "robustness": 5,
+}
+
+# 원점수 행렬의 열 순서와 가중치 벡터 (벡터화 합산용)
+METRIC_NAMES = list(METRIC_WEIGHTS)
+WEIGHT_VECTOR = np.array([METRIC_WEIGHTS[name] for name in METRIC_NAMES], dtype=np.float32)
+
+# 채점할 내용이 없는 응답(빈 응답, 에이전트 호출 실패, 오류 메시지)은 Judge 호출 없이 전 지표 0점 처리
+UNSCORABLE_PREFIXES = ("응답 없음", "❌")
+MIN_ANSWER_LENGTH = 5
+UNSCORABLE_REASON = "채점 생략: 빈 응답 또는 오류 응답"
+
+def is_unscorable(answer: Optional[str]) -> bool:
+    """5가지 지표 모두 0점을 넘을 수 없는 응답인지 판별합니다."""
+    text = (answer or "").strip()
+    return len(text) < MIN_ANSWER_LENGTH or text.startswith(UNSCORABLE_PREFIXES)
+
+# 채점 방식: "fused"(5개 축을 Gemini 1회 호출로 채점) | "geval"(메트릭별 GEval 개별 호출)
+JUDGE_MODE = os.getenv("EVAL_JUDGE", "fused")
+
+class AxisScore(BaseModel):
+    score: float = Field(ge=0, le=1, description="0(기준 미충족) ~ 1(기준 완전 충족) 사이의 점수")
+    reason: str = Field(description="점수의 근거 (입력/응답의 구체적인 내용을 언급)")
+
+class FusedJudge(GoogleGemini):
+    """
+    5개 평가 축을 한 번의 Gemini 호출로 채점하는 Judge.
+    축마다 반복 전송되던 입력/응답/컨텍스트를 한 번만 보내므로 호출 수는 1/5, 프롬프트 토큰은 약 1/4로 줄어듭니다.
+    채점 기준(criteria)은 각 GEval 메트릭 정의를 그대로 재사용합니다.
+    """
+    def __init__(self, metrics: dict, **kwargs):
+        self.metrics = metrics
+        # 채점 대상 축별 (점수, 사유) 구조화 출력 스키마
+        self.schema = create_model("FusedScores", **{name: (AxisScore, ...) for name in metrics})
+        criteria = "\n".join(
+            f"[{name}] ({', '.join(p.value for p in metric.evaluation_params)})\n{textwrap.dedent(metric.criteria).strip()}\n"
+            for name, metric in metrics.items()
+        )
+        # 채점 지시문과 기준은 모든 문항에서 동일하므로 system instruction으로 분리
+        self.instructions = (
+            "You are an evaluator. Score the response on each of the following axes "
+            f"({', '.join(metrics)}), "
+            "using only the test case parameters listed next to each axis.\n\n"
+            f"Evaluation Criteria:\n{criteria}"
+        )
+        super().__init__(system_instructions=self.instructions, **kwargs)
+        self._structured = self.model.with_structured_output(self.schema)
+
+    def build_prompt(self, test_case) -> str:
+        context = "\n".join(test_case.retrieval_context or [])
+        return (
+            f"Input:\n{test_case.input}\n\n"
+            f"Actual Output:\n{test_case.actual_output}\n\n"
+            f"Expected Output:\n{test_case.expected_output}\n\n"
+            f"Retrieval Context:\n{context}\n"
+        )
+
+    def _to_results(self, result: BaseModel) -> dict:
+        return {name: (getattr(result, name).score, getattr(result, name).reason) for name in self.metrics}
+
+    def score(self, test_case) -> dict:
+        """축별 (원점수 0~1, 사유)를 반환합니다."""
+        return self._to_results(self._structured.invoke(self._messages(self.build_prompt(test_case))))
+
+    async def a_score(self, test_case) -> dict:
+        """축별 (원점수 0~1, 사유)를 반환합니다."""
+        return self._to_results(await self._structured.ainvoke(self._messages(self.build_prompt(test_case))))
+
+    def get_model_name(self):
+        return "Google Gemini (Fused Judge)"
+
+fused_judge = FusedJudge(JUDGE_METRICS, service_tier=os.getenv("GEMINI_TIER", "standard"))
+
+def check_shared_http_client():
+    """
+    모든 Judge(GEval 메트릭의 모델, Fused Judge)가 공유 HTTP/2 연결 풀을 사용하는지 확인합니다.
+    DeepEval 버전에 따라 메트릭이 모델을 복제/재생성하면 연결 풀 공유가 깨지므로 시작 시점에 검증합니다.
+    """
+    judges = [metric.model for metric in JUDGE_METRICS.values()] + [fused_judge]
+    for judge in judges:
+        if judge.model.client._api_client._async_httpx_client is not http_async_client:
+            raise RuntimeError(f"{judge.get_model_name()}가 공유 HTTP 클라이언트를 사용하지 않습니다.")
+
+async def aclose_http_client():
+    """평가 종료 시 공유 HTTP/2 연결 풀을 닫습니다."""
+    await http_async_client.aclose()
+
+check_shared_http_client()
+
+def weighted_scores(raw: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    (문항 수, 메트릭 수) 원점수(0~1) 행렬에 가중치를 곱하고 문항별 100점 만점 총점을 계산합니다.
+    열 순서는 METRIC_NAMES를 따르며, 온라인 채점과 Batch API 채점 결과 모두 이 함수로 합산합니다.
+    반환값: (축별 가중 점수 행렬, 문항별 100점 환산 총점 벡터)
+    """
+    per_axis = raw * WEIGHT_VECTOR
+
+    # 문항 단위 가중치 총합이 65이므로, 100점 만점으로 환산
+    scaled = per_axis.sum(axis=1) / WEIGHT_VECTOR.sum() * 100
+
+    return per_axis, scaled
+
+def weighted_score(raw_scores: dict) -> tuple[float, dict]:
+    """메트릭별 원점수(0~1) dict 한 건을 가중 합산합니다. (weighted_scores의 단건 버전)"""
+    per_axis, scaled = weighted_scores(np.array([[raw_scores[name] for name in METRIC_NAMES]], dtype=np.float32))
+    return float(scaled[0]), dict(zip(METRIC_NAMES, per_axis[0].tolist()))
+
 def calculate_weighted_score(TestCase) -> tuple[float, dict]:
     """
     주어진 테스트 케이스에 대해 모든 메트릭을 비동기로 평가하고,
@@ -103,25 +298,18 @@ def calculate_weighted_score(TestCase) -> tuple[float, dict]:
     - Robustness: 5
     """
     
+    if is_unscorable(TestCase.actual_output):
+        return 0.0, {name: 0.0 for name in METRIC_NAMES}
+
+    if JUDGE_MODE == "fused":
+        # LLM Judge 대상 축은 한 번의 호출로 채점, 로컬 메트릭은 직접 계산
+        results = fused_judge.score(TestCase)
+        results.update({name: (metric.measure(TestCase), metric.reason) for name, metric in LOCAL_METRICS.items()})
+        return weighted_score({name: score for name, (score, _) in results.items()})
+
     # 각 메트릭 측정 (measure 동작)
-    groundedness_metric.measure(TestCase)
-    evidenceability_metric.measure(TestCase)
-    clarity_metric.measure(TestCase)
-    atomicity_metric.measure(TestCase)
-    robustness_metric.measure(TestCase)
+    for metric in METRICS.values():
+        metric.measure(TestCase)
     
     # GEval 스코어는 0~1 사이의 값으로 나옴
-    scores = {
-        "groundedness": groundedness_metric.score * 25,
-        "evidenceability": evidenceability_metric.score * 15,
-        "clarity": clarity_metric.score * 10,
-        "atomicity": atomicity_metric.score * 10,
-        "robustness": robustness_metric.score * 5
-    }
-    
-    item_total = sum(scores.values())
-    
-    # 문항 단위 가중치 총합이 65이므로, 100점 만점으로 환산
-    scaled_score = (item_total / 65) * 100
-    
-    return scaled_score, scores
+    return weighted_score({name: metric.score for name, metric in METRICS.items()})
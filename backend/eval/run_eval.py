@@ -1,6 +1,13 @@
 import os
+import copy
 import json
+import time
 import asyncio
+import uuid
+import importlib
+from typing import Optional
+import numpy as np
+import orjson
 from dotenv import load_dotenv
 
 # 평가 실행 시 메인 에이전트(app_graph)도 EVAL_GEMINI_API_KEY를 사용하도록 환경변수 강제 덮어쓰기
@@ -9,24 +16,28 @@ if os.getenv("EVAL_GEMINI_API_KEY"):
     os.environ["GOOGLE_API_KEY"] = os.environ["EVAL_GEMINI_API_KEY"]
 
 from supabase import create_client, Client
+from google import genai
 from rich.console import Console
 from rich.progress import Progress, SpinnerColumn, TextColumn, BarColumn, TimeElapsedColumn
 from rich.panel import Panel
 from rich.table import Table
+from langchain_core.messages import HumanMessage, AIMessage
 from deepeval.test_case import LLMTestCase
+from deepeval.metrics.g_eval.utils import (
+    construct_g_eval_params_string,
+    construct_test_case_string,
+    number_evaluation_steps,
+)
 
 import sys
 sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
 
 from eval_metrics import (
-    groundedness_metric,
-    evidenceability_metric,
-    clarity_metric,
-    atomicity_metric,
-    robustness_metric
+    METRICS, JUDGE_METRICS, LOCAL_METRICS, JUDGE_MODE, METRIC_NAMES, UNSCORABLE_REASON,
+    fused_judge, weighted_scores, is_unscorable, aclose_http_client,
 )
-
-from backend.main import app_graph, HumanMessage, AIMessage, SystemMessage, SYSTEM_PROMPT
+import _response_cache as response_cache
+from _fast_scoring import rouge_l
 
 load_dotenv()
 SUPABASE_URL = os.getenv("SUPABASE_URL")
@@ -34,19 +45,136 @@ SUPABASE_KEY = os.getenv("SUPABASE_KEY")
 supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
 console = Console()
 
-def fetch_eval_data_from_db():
-    response = supabase.table("evaluation_dataset").select("*").execute()
-    return response.data
+# 에이전트(LangGraph + 도구 + Gemini 클라이언트)는 import 비용이 크므로 모듈 로드 시점이 아닌
+# 평가 시작 시 백그라운드로 import하여 Supabase 조회와 겹쳐서 진행 (start_agent_import 참고)
+app_graph = None
+_agent_task: Optional[asyncio.Task] = None
+
+# Batch API 설정 (오프라인 채점 전용, 온라인 호출 대비 50% 비용)
+BATCH_MODEL = os.getenv("EVAL_BATCH_MODEL", "gemini-2.5-flash")
+BATCH_POLL_SECONDS = 30
+BATCH_SUCCESS_STATES = {"JOB_STATE_SUCCEEDED", "JOB_STATE_PARTIALLY_SUCCEEDED"}
+BATCH_DONE_STATES = BATCH_SUCCESS_STATES | {"JOB_STATE_FAILED", "JOB_STATE_CANCELLED", "JOB_STATE_EXPIRED"}
+BATCH_FILE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "batch_requests.jsonl")
+
+class AsyncRateLimiter:
+    """
+    분당 요청 수(RPM) 제한을 지키기 위한 토큰 버킷.
+    고정 sleep 대신 버킷이 비었을 때만 다음 토큰이 채워질 때까지 대기합니다.
+    """
+    def __init__(self, max_rate: int, time_period: float = 60):
+        self.max_rate = max_rate
+        self.time_period = time_period
+        self._tokens = float(max_rate)
+        self._last_refill = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                refill = (now - self._last_refill) * self.max_rate / self.time_period
+                self._tokens = min(self.max_rate, self._tokens + refill)
+                self._last_refill = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) * self.time_period / self.max_rate)
+
+    async def __aenter__(self):
+        await self.acquire()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        return False
+
+# Gemini API 호출 공통 Rate Limiter (무료 티어 기본 15 RPM, 유료 티어는 GEMINI_RPM으로 상향)
+RATE = AsyncRateLimiter(int(os.getenv("GEMINI_RPM", 15)), 60)
+
+# Judge 동시 호출 수 상한 (계정 QPS에 맞춰 조정, 5개 메트릭이 동시에 요청되더라도 429 방지)
+JUDGE_CONCURRENCY = int(os.getenv("EVAL_JUDGE_CONCURRENCY", 5))
+judge_semaphore = asyncio.Semaphore(JUDGE_CONCURRENCY)
+
+# 동시에 평가하는 문항 수 상한 (문항 간에는 Rate Limiter만 공유하므로 서로 독립적으로 진행)
+EVAL_CONCURRENCY = int(os.getenv("EVAL_CONCURRENCY", 4))
+eval_semaphore = asyncio.Semaphore(EVAL_CONCURRENCY)
+
+# 평가 데이터 페이지 크기 / 평가 문항 수 상한 (0이면 전체)
+EVAL_PAGE_SIZE = 500
+EVAL_LIMIT = int(os.getenv("EVAL_LIMIT", 5))
+
+# 평가 결과 저장 (실행마다 run_id를 부여하여 eval_results 테이블에 upsert, 재실행 시 중복 행 방지)
+RUN_ID = uuid.uuid4().hex
+RESULTS_TABLE = "eval_results"
+RESULTS_BATCH_SIZE = int(os.getenv("SUPABASE_BATCH", 500))
+
+# 결과 테이블/JSON에 사용하는 메트릭 약어
+LOG_KEYS = {
+    "groundedness": "Grd",
+    "evidenceability": "Evi",
+    "clarity": "Cla",
+    "atomicity": "Ato",
+    "robustness": "Rob",
+}
+
+async def stream_eval_data(page: int = EVAL_PAGE_SIZE, limit: int = EVAL_LIMIT):
+    """
+    평가 데이터셋을 페이지 단위(range)로 조회하며 한 행씩 반환하는 비동기 제너레이터.
+    전체 테이블을 한 번에 메모리에 올리지 않고, 첫 페이지가 도착하는 즉시 채점을 시작할 수 있습니다.
+    limit이 0이면 전체 행을 조회합니다.
+    """
+    offset = 0
+    while not limit or offset < limit:
+        end = offset + page - 1 if not limit else min(offset + page, limit) - 1
+        rows = await asyncio.to_thread(
+            lambda: supabase.table("evaluation_dataset").select("*").order("id").range(offset, end).execute().data
+        )
+        for row in rows:
+            # retrieval_context 문자열은 행마다 한 번만 직렬화해 두고 채점 시 재사용
+            context_refs = row.get("context_references")
+            row["_ctx_str"] = orjson.dumps(context_refs).decode() if context_refs else "No explicit context provided"
+            yield row
+        if len(rows) < end - offset + 1:
+            return
+        offset = end + 1
+
+async def _load_agent():
+    global app_graph
+    agent = await asyncio.to_thread(importlib.import_module, "backend.main")
+    # 평가는 문항마다 독립된 단발성 대화이므로 체크포인터 없이 컴파일 (문항별 체크포인트 저장 생략)
+    app_graph = agent.workflow.compile()
+
+def start_agent_import() -> asyncio.Task:
+    """에이전트 모듈 import를 백그라운드 태스크로 시작합니다. (이미 시작된 경우 기존 태스크 반환)"""
+    global _agent_task
+    if _agent_task is None:
+        _agent_task = asyncio.create_task(_load_agent())
+    return _agent_task
+
+def extract_answer(messages: list) -> str:
+    """마지막 AIMessage의 content를 문자열로 변환합니다. (파트 목록 형태의 content는 텍스트를 이어 붙임)"""
+    content = next((m.content for m in reversed(messages) if type(m) is AIMessage), "")
+    if isinstance(content, list):
+        content = "".join(part.get("text", "") if isinstance(part, dict) else str(part) for part in content)
+    return content
+
+async def generate_agent_response(question: str, retries=3) -> str:
+    """Agent에 비동기로 질문을 던져 응답을 가져옵니다. (Rate Limit 대응, 디스크 캐시 적중 시 호출 생략)"""
+    cached_answer = response_cache.get_answer(question)
+    if cached_answer is not None:
+        return cached_answer
+
+    # 캐시 미스일 때만 에이전트 import 완료를 기다림
+    await start_agent_import()
+
+    # 시스템 프롬프트는 에이전트 노드(billing_agent)가 붙이므로 질문만 전달
+    input_data = {"messages": [HumanMessage(content=question)]}
 
-async def generate_agent_response(question: str, user_id: str, retries=3) -> str:
-    """Agent에 비동기로 질문을 던져 응답을 가져옵니다. (Rate Limit 대응)"""
-    config = {"configurable": {"thread_id": f"eval_{user_id}"}}
-    input_data = {"messages": [SystemMessage(content=SYSTEM_PROMPT), HumanMessage(content=question)]}
-    
     for attempt in range(retries):
         try:
-            final_state = await app_graph.ainvoke(input_data, config=config)
-            ai_msg = next((m for m in reversed(final_state["messages"]) if isinstance(m, AIMessage)), None)
+            async with RATE:
+                final_state = await app_graph.ainvoke(input_data)
+            answer = extract_answer(final_state["messages"])
             break
         except Exception as e:
             if "429" in str(e) or "RESOURCE_EXHAUSTED" in str(e):
@@ -56,22 +184,56 @@ async def generate_agent_response(question: str, user_id: str, retries=3) -> str
                     return "응답 없음 (Rate Limit)"
             else:
                 return f"응답 없음 ({e})"
-    
-    if not ai_msg:
+
+    if not answer:
         return "응답 없음"
-        
-    if isinstance(ai_msg.content, str):
-        return ai_msg.content
-    elif isinstance(ai_msg.content, list):
-        return "".join([part.get("text", "") for part in ai_msg.content if isinstance(part, dict)])
-    return str(ai_msg.content)
 
-async def measure_metric_with_retry(metric, test_case, retries=3):
+    # 정상 응답만 캐시 (오류/Rate Limit 응답은 다음 실행에서 재시도)
+    response_cache.set_answer(question, answer)
+    return answer
+
+def build_test_case(data: dict, actual_answer: str) -> LLMTestCase:
+    """DB 문항과 에이전트 응답으로 DeepEval용 LLMTestCase를 생성합니다."""
+    return LLMTestCase(
+        input=data["question"],
+        actual_output=actual_answer,
+        expected_output=data["expected_answer"],
+        retrieval_context=[data["_ctx_str"]]
+    )
+
+def build_log_row(q_id, data: dict, actual_answer: str, scaled_100: float, scores: dict, reasons: dict) -> dict:
+    """문항 단위 채점 결과를 결과 로그(테이블/JSON) 형식으로 변환합니다."""
+    row = {"id": q_id, "score": scaled_100}
+    row.update({LOG_KEYS[name]: value for name, value in scores.items()})
+    row.update({
+        # 진단용 지표 (가중 총점 미포함): 정답과의 토큰 LCS 기반 ROUGE-L F1
+        "RgL": rouge_l(data["expected_answer"], actual_answer),
+        "actual_output": actual_answer,
+        "expected_output": data["expected_answer"],
+        "context": data.get("context_references", []),
+        "reason_Grd": reasons.get("groundedness"),
+        "reason_Evi": reasons.get("evidenceability")
+    })
+    return row
+
+def build_results_log(entries: list, raw: np.ndarray) -> tuple[list, np.ndarray]:
+    """
+    문항별 원점수 행렬(문항 수 x 메트릭 수)을 한 번에 가중 합산하여 결과 로그와 총점 벡터를 반환합니다.
+    entries: 원점수 행렬의 각 행에 대응하는 (문항 ID, DB 문항, 에이전트 응답, 메트릭별 사유)
+    """
+    per_axis, scaled = weighted_scores(raw)
+    results_log = [
+        build_log_row(q_id, data, actual_answer, total, dict(zip(METRIC_NAMES, axis_scores)), reasons)
+        for (q_id, data, actual_answer, reasons), total, axis_scores in zip(entries, scaled.tolist(), per_axis.tolist())
+    ]
+    return results_log, scaled
+
+async def judge_with_retry(judge_call, retries=3):
     """Gemini API 429 에러(Rate Limit) 발생 시 대기 후 재시도하는 래퍼 함수"""
     for attempt in range(retries):
         try:
-            await metric.a_measure(test_case)
-            return
+            async with judge_semaphore, RATE:
+                return await judge_call()
         except Exception as e:
             error_str = str(e)
             if "429" in error_str or "RESOURCE_EXHAUSTED" in error_str:
@@ -83,89 +245,137 @@ async def measure_metric_with_retry(metric, test_case, retries=3):
             else:
                 raise e
 
-async def main():
-    console.print(Panel("[bold green]🚀 요금 안내 AI 모델 (LLM as a Judge) 자동 채점 파이프라인[/bold green]", expand=False))
-    
-    with console.status("[bold cyan]📥 Supabase에서 평가 데이터셋 조회 중...[/bold cyan]"):
-        dataset = fetch_eval_data_from_db()
-
-    if not dataset:
-        console.print("[bold red]❌ 평가할 데이터가 DB에 없습니다.[/bold red]")
+async def measure_metric_with_retry(metric, test_case, retries=3):
+    """GEval 메트릭 하나를 채점합니다. (디스크 캐시 적중 시 호출 생략)"""
+    criteria = f"{metric.criteria}|{[p.value for p in metric.evaluation_params]}"
+    cached = response_cache.get_metric_score(test_case, metric.name, criteria)
+    if cached is not None:
+        metric.score, metric.reason = cached
         return
 
-    eval_subset = dataset[:5]
-    console.print(f"✅ 평가 진행 문항 수: [bold yellow]{len(eval_subset)}[/bold yellow]건\n")
-    
-    total_scaled_score = 0
-    results_log = []
-    
-    with Progress(
-        SpinnerColumn(),
-        TextColumn("[progress.description]{task.description}"),
-        BarColumn(),
-        "[progress.percentage]{task.percentage:>3.0f}%",
-        TimeElapsedColumn(),
-        console=console,
-        transient=False
-    ) as progress:
-        
-        main_task = progress.add_task("[bold cyan]전체 평가 진행률", total=len(eval_subset))
-        
-        for idx, data in enumerate(eval_subset):
-            q_id = data.get("id", str(idx))
-            question = data["question"]
-            expected_ans = data["expected_answer"]
-            context_refs = data.get("context_references", [])
-            
-            progress.update(main_task, description=f"[cyan]문항 {idx+1}/{len(eval_subset)} 평가 중: [white]{question[:15]}...")
-            
-            # 시스템에 질문 던지기 (비동기)
-            actual_answer = await generate_agent_response(question, q_id)
-            
-            # DeepEval용 LLMTestCase 생성
-            test_case = LLMTestCase(
-                input=question,
-                actual_output=actual_answer,
-                expected_output=expected_ans,
-                retrieval_context=[json.dumps(context_refs)] if context_refs else ["No explicit context provided"]
-            )
-            
-            try:
-                # 각 메트릭마다 Rate limit 429 회피용 재시도 함수 사용
-                await measure_metric_with_retry(groundedness_metric, test_case)
-                await measure_metric_with_retry(evidenceability_metric, test_case)
-                await measure_metric_with_retry(clarity_metric, test_case)
-                await measure_metric_with_retry(atomicity_metric, test_case)
-                await measure_metric_with_retry(robustness_metric, test_case)
-                
-                # 가중치 계산 체계
-                g_score = groundedness_metric.score * 25
-                e_score = evidenceability_metric.score * 15
-                c_score = clarity_metric.score * 10
-                a_score = atomicity_metric.score * 10
-                r_score = robustness_metric.score * 5
-                
-                item_score = g_score + e_score + c_score + a_score + r_score
-                scaled_100 = (item_score / 65) * 100
-                total_scaled_score += scaled_100
-                
-                results_log.append({
-                    "id": q_id,
-                    "score": scaled_100,
-                    "Grd": g_score, "Evi": e_score, "Cla": c_score, "Ato": a_score, "Rob": r_score,
-                    "actual_output": actual_answer,
-                    "expected_output": expected_ans,
-                    "context": context_refs,
-                    "reason_Grd": groundedness_metric.reason,
-                    "reason_Evi": evidenceability_metric.reason
-                })
-                
-            except Exception as e:
-                console.print(f"[bold red]❌ 채점 오류 발생 (문항 {idx+1}): {e}[/bold red]")
-                
-            # 평가 한 건 완료마다 게이지 바 채우기
-            progress.advance(main_task)
+    await judge_with_retry(lambda: metric.a_measure(test_case), retries)
+    response_cache.set_metric_score(test_case, metric.name, criteria, metric.score, metric.reason)
+
+async def fused_score_with_retry(test_case, retries=3) -> dict:
+    """Fused Judge로 LLM Judge 대상 축을 한 번에 채점합니다. (디스크 캐시 적중 시 호출 생략)"""
+    cached = {name: response_cache.get_metric_score(test_case, f"fused:{name}", fused_judge.instructions) for name in JUDGE_METRICS}
+    if all(result is not None for result in cached.values()):
+        return cached
+
+    results = await judge_with_retry(lambda: fused_judge.a_score(test_case), retries)
+    for name, (score, reason) in results.items():
+        response_cache.set_metric_score(test_case, f"fused:{name}", fused_judge.instructions, score, reason)
+    return results
+
+def score_local_metrics(test_case) -> dict:
+    """로컬 메트릭(임베딩 기반)의 축별 (원점수 0~1, 사유)를 반환합니다. (CPU 연산이므로 asyncio.to_thread로 호출)"""
+    return {name: metric.evaluate(test_case) for name, metric in LOCAL_METRICS.items()}
+
+async def prepare_evaluation_steps():
+    """
+    GEval의 criteria → evaluation steps 변환을 공유 메트릭에 미리 한 번만 수행합니다.
+    a_measure는 단계를 자기 인스턴스에 저장하므로, 문항별 사본에서 처음 생성하면 공유 메트릭에 남지 않아 문항마다 재생성됩니다.
+    """
+    async def generate(metric):
+        if not metric.evaluation_steps:
+            metric.evaluation_steps = await judge_with_retry(lambda: metric._a_generate_evaluation_steps(multimodal=False))
+
+    await asyncio.gather(*(generate(metric) for metric in JUDGE_METRICS.values()))
+
+async def score_test_case(test_case) -> dict:
+    """채점 방식(EVAL_JUDGE)에 따라 축별 (원점수 0~1, 사유)를 반환합니다."""
+    # 빈 응답/오류 응답은 Judge 호출 없이 0점
+    if is_unscorable(test_case.actual_output):
+        return {name: (0.0, UNSCORABLE_REASON) for name in METRICS}
+
+    # 로컬 메트릭은 API 호출이 없으므로 Rate Limiter를 거치지 않고, 임베딩 계산이 다른 문항의 채점을 막지 않도록 스레드에서 계산
+    results = await asyncio.to_thread(score_local_metrics, test_case)
+
+    if JUDGE_MODE == "fused":
+        results.update(await fused_score_with_retry(test_case))
+        return results
+
+    # GEval은 채점 결과를 인스턴스 속성(score/reason)에 저장하므로, 여러 문항을 동시에 채점할 때 섞이지 않도록 문항별 사본 사용
+    # (evaluation steps는 prepare_evaluation_steps에서 미리 생성되어 사본이 그대로 공유하므로 Judge 호출은 문항당 1회)
+    metrics = {name: copy.copy(metric) for name, metric in JUDGE_METRICS.items()}
+
+    # LLM Judge 메트릭은 서로 독립적이므로 동시에 채점
+    await asyncio.gather(*(measure_metric_with_retry(metric, test_case) for metric in metrics.values()))
+    results.update({name: (metric.score, metric.reason) for name, metric in metrics.items()})
+    return results
+
+# ─────────────────────────────────────────
+# Batch API 채점 (오프라인 일괄 처리)
+# ─────────────────────────────────────────
+def render_geval_prompt(metric, test_case: LLMTestCase) -> str:
+    """GEval이 Judge 모델에 보낼 채점 프롬프트를 모델 호출 없이 렌더링합니다."""
+    if not metric.evaluation_steps:
+        # criteria → evaluation steps 변환은 메트릭당 한 번만 온라인으로 수행 (이후 재사용)
+        metric.evaluation_steps = metric._generate_evaluation_steps(multimodal=False)
+
+    return metric.evaluation_template.generate_evaluation_results(
+        evaluation_steps=number_evaluation_steps(metric.evaluation_steps),
+        test_case_content=construct_test_case_string(metric.evaluation_params, test_case),
+        parameters=construct_g_eval_params_string(metric.evaluation_params),
+        score_range=metric.score_range,
+    )
+
+def write_batch_requests(test_cases: dict, path: str = BATCH_FILE_PATH) -> str:
+    """(문항, 메트릭) 조합별 채점 프롬프트를 Batch API 입력 JSONL로 저장합니다."""
+    with open(path, "w", encoding="utf-8") as f:
+        for q_id, test_case in test_cases.items():
+            for name, metric in JUDGE_METRICS.items():
+                line = {
+                    "key": f"{q_id}:{name}",
+                    "request": {
+                        "contents": [{"role": "user", "parts": [{"text": render_geval_prompt(metric, test_case)}]}],
+                        "generation_config": {"response_mime_type": "application/json"}
+                    }
+                }
+                f.write(json.dumps(line, ensure_ascii=False) + "\n")
+    return path
+
+def submit_batch_job(client: genai.Client, path: str):
+    """JSONL 파일을 업로드하고 Batch 작업을 생성합니다."""
+    uploaded = client.files.upload(
+        file=path,
+        config={"display_name": "eval-batch-requests", "mime_type": "jsonl"}
+    )
+    return client.batches.create(
+        model=BATCH_MODEL,
+        src=uploaded.name,
+        config={"display_name": "eval-batch-job"}
+    )
+
+async def wait_for_batch_job(client: genai.Client, job):
+    """Batch 작업이 종료 상태가 될 때까지 주기적으로 상태를 조회합니다. (대기 중에도 이벤트 루프를 막지 않음)"""
+    with console.status(f"[bold cyan]⏳ Batch 작업 처리 대기 중... ({job.name})[/bold cyan]"):
+        while job.state.name not in BATCH_DONE_STATES:
+            await asyncio.sleep(BATCH_POLL_SECONDS)
+            job = await client.aio.batches.get(name=job.name)
+    return job
 
+def parse_batch_results(content: bytes) -> dict:
+    """Batch 결과 JSONL을 파싱하여 {문항 ID: {메트릭: (원점수 0~1, 사유)}} 형태로 반환합니다."""
+    results = {}
+    for line in content.decode("utf-8").splitlines():
+        if not line.strip():
+            continue
+        item = json.loads(line)
+        q_id, name = item["key"].rsplit(":", 1)
+        try:
+            text = item["response"]["candidates"][0]["content"]["parts"][0]["text"]
+            data = json.loads(text[text.find("{"):text.rfind("}") + 1])
+            low, high = JUDGE_METRICS[name].score_range
+            score = (float(data["score"]) - low) / (high - low)
+        except (KeyError, IndexError, ValueError) as e:
+            console.print(f"[bold red]❌ Batch 응답 파싱 실패 ({item['key']}): {item.get('error', e)}[/bold red]")
+            continue
+        results.setdefault(q_id, {})[name] = (score, data.get("reason"))
+    return results
+
+def report_results(results_log: list, scaled: np.ndarray):
+    """문항별 채점 결과를 테이블로 출력하고 JSON 파일로 저장합니다. (scaled: 문항별 100점 환산 총점 벡터)"""
     # 평가 결과 테이블 UI 구성
     print("\n")
     table = Table(title="📊 문항 단위 개별 평가 결과 요약", show_header=True, header_style="bold magenta")
@@ -176,26 +386,37 @@ async def main():
     table.add_column("명확(10)", justify="right")
     table.add_column("원자(10)", justify="right")
     table.add_column("강건(5)", justify="right")
+    table.add_column("ROUGE-L", justify="right", style="dim")
 
     for log in results_log:
         table.add_row(
             str(log["id"])[:8],
             f"{log['score']:.1f}",
-            f"{log['Grd']:.1f}", f"{log['Evi']:.1f}", f"{log['Cla']:.1f}", f"{log['Ato']:.1f}", f"{log['Rob']:.1f}"
+            f"{log['Grd']:.1f}", f"{log['Evi']:.1f}", f"{log['Cla']:.1f}", f"{log['Ato']:.1f}", f"{log['Rob']:.1f}",
+            f"{log['RgL']:.2f}"
         )
 
     console.print(table)
-    
+
     if results_log:
-        final_avg = total_scaled_score / len(results_log)
-        console.print(Panel(f"[bold gold1]🏆 미니 배치 최종 평균 평가 점수: {final_avg:.1f} / 100점[/bold gold1]", expand=False))
+        final_avg = float(scaled.mean())
+        score_std = float(scaled.std())
+        p10, p50, p90 = np.percentile(scaled, [10, 50, 90]).tolist()
+        console.print(Panel(
+            f"[bold gold1]🏆 미니 배치 최종 평균 평가 점수: {final_avg:.1f} / 100점[/bold gold1]\n"
+            f"[dim]표준편차 {score_std:.1f} · P10 {p10:.1f} · 중앙값 {p50:.1f} · P90 {p90:.1f}[/dim]",
+            expand=False
+        ))
 
         # 평가 결과를 JSON 파일로 히스토리 저장
         output_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "eval_results.json")
         try:
             with open(output_path, "w", encoding="utf-8") as f:
                 json.dump({
+                    "run_id": RUN_ID,
                     "average_score": final_avg,
+                    "score_std": score_std,
+                    "score_percentiles": {"p10": p10, "p50": p50, "p90": p90},
                     "total_evaluated": len(results_log),
                     "details": results_log
                 }, f, ensure_ascii=False, indent=2)
@@ -203,5 +424,188 @@ async def main():
         except Exception as e:
             console.print(f"\n[red]❌ 결과 저장 실패: {e}[/red]")
 
+async def score_one(idx: int, data: dict, progress: Progress, task_id) -> Optional[tuple]:
+    """
+    문항 하나에 대해 에이전트 응답 생성 → 채점을 수행합니다. (EVAL_CONCURRENCY개 문항까지 동시 진행)
+    반환값: ((문항 ID, DB 문항, 에이전트 응답, 메트릭별 사유), 원점수 행) / 채점 실패 시 None
+    """
+    async with eval_semaphore:
+        q_id = data.get("id", str(idx))
+
+        # 시스템에 질문 던지기 (비동기)
+        actual_answer = await generate_agent_response(data["question"])
+
+        # DeepEval용 LLMTestCase 생성
+        test_case = build_test_case(data, actual_answer)
+
+        try:
+            # 채점 (Rate limit 429 회피용 재시도 함수 사용)
+            results = await score_test_case(test_case)
+            entry = (q_id, data, actual_answer, {name: reason for name, (_, reason) in results.items()})
+            return entry, [results[name][0] for name in METRIC_NAMES]
+
+        except Exception as e:
+            console.print(f"[bold red]❌ 채점 오류 발생 (문항 {idx+1}): {e}[/bold red]")
+            return None
+
+        finally:
+            # 평가 한 건 완료마다 게이지 바 채우기
+            progress.advance(task_id)
+
+def persist_results(results_log: list):
+    """
+    문항별 채점 결과를 Supabase eval_results 테이블에 저장합니다.
+    문항마다 insert하지 않고 RESULTS_BATCH_SIZE 단위 bulk upsert로 왕복 횟수를 최소화합니다. (키: run_id, question_id)
+    """
+    rows = [
+        {
+            "run_id": RUN_ID,
+            "question_id": str(log["id"]),
+            "score": log["score"],
+            **{name: log[key] for name, key in LOG_KEYS.items()},
+            "rouge_l": log["RgL"],
+            "actual_output": log["actual_output"],
+            "reason_groundedness": log["reason_Grd"],
+            "reason_evidenceability": log["reason_Evi"],
+        }
+        for log in results_log
+    ]
+
+    saved = 0
+    for offset in range(0, len(rows), RESULTS_BATCH_SIZE):
+        chunk = rows[offset:offset + RESULTS_BATCH_SIZE]
+        try:
+            supabase.table(RESULTS_TABLE).upsert(chunk, on_conflict="run_id,question_id").execute()
+            saved += len(chunk)
+        except Exception as e:
+            console.print(f"[red]❌ 평가 결과 DB 저장 실패 ({offset}~{offset + len(chunk) - 1}번 행): {e}[/red]")
+
+    if saved:
+        console.print(f"[green]🗄️ 평가 결과 {saved}건을 '{RESULTS_TABLE}' 테이블에 저장했습니다. (run_id: {RUN_ID})[/green]")
+
+async def main():
+    console.print(Panel("[bold green]🚀 요금 안내 AI 모델 (LLM as a Judge) 자동 채점 파이프라인[/bold green]", expand=False))
+    start_agent_import()
+
+    with Progress(
+        SpinnerColumn(),
+        TextColumn("[progress.description]{task.description}"),
+        BarColumn(),
+        "[progress.percentage]{task.percentage:>3.0f}%",
+        TimeElapsedColumn(),
+        console=console,
+        transient=False
+    ) as progress:
+
+        main_task = progress.add_task("[bold cyan]전체 평가 진행률", total=EVAL_LIMIT or None)
+
+        if JUDGE_MODE == "geval":
+            await prepare_evaluation_steps()
+
+        # Supabase 페이지 조회와 채점을 겹쳐서 진행 (행이 도착하는 즉시 문항별 채점 태스크 시작)
+        tasks = []
+        async for data in stream_eval_data():
+            tasks.append(asyncio.create_task(score_one(len(tasks), data, progress, main_task)))
+
+        progress.update(main_task, total=len(tasks))
+        scored = [result for result in await asyncio.gather(*tasks) if result is not None]
+
+    if not tasks:
+        console.print("[bold red]❌ 평가할 데이터가 DB에 없습니다.[/bold red]")
+        return
+
+    console.print(f"✅ 평가 진행 문항 수: [bold yellow]{len(tasks)}[/bold yellow]건\n")
+
+    # 문항별 원점수는 (문항 수 x 메트릭 수) 행렬로 모아 한 번에 가중 합산
+    entries = [entry for entry, _ in scored]
+    raw = np.array([raw_row for _, raw_row in scored], dtype=np.float32).reshape(-1, len(METRIC_NAMES))
+    results_log, scaled = build_results_log(entries, raw)
+    report_results(results_log, scaled)
+    persist_results(results_log)
+
+async def main_batch():
+    """
+    Batch API 기반 오프라인 채점 파이프라인.
+    1단계: 에이전트 응답을 수집하고 (문항, 메트릭)별 GEval 프롬프트를 JSONL로 묶어 Batch 작업으로 제출
+    2단계: 작업 완료 후 결과를 내려받아 문항별 가중 총점(25/15/10/10/5 → 100점 환산)으로 재조립
+    """
+    console.print(Panel("[bold green]🚀 요금 안내 AI 모델 (LLM as a Judge) 자동 채점 파이프라인 - Batch API 모드[/bold green]", expand=False))
+    start_agent_import()
+
+    with console.status("[bold cyan]📥 Supabase에서 평가 데이터셋 조회 중...[/bold cyan]"):
+        eval_subset = [data async for data in stream_eval_data()]
+
+    if not eval_subset:
+        console.print("[bold red]❌ 평가할 데이터가 DB에 없습니다.[/bold red]")
+        return
+
+    console.print(f"✅ 평가 진행 문항 수: [bold yellow]{len(eval_subset)}[/bold yellow]건\n")
+
+    # 1단계: 에이전트 응답 수집 및 Batch 요청 파일 생성
+    test_cases = {}
+    with console.status("[bold cyan]🤖 에이전트 응답 수집 중...[/bold cyan]"):
+        for idx, data in enumerate(eval_subset):
+            q_id = str(data.get("id", idx))
+            actual_answer = await generate_agent_response(data["question"])
+            test_cases[q_id] = build_test_case(data, actual_answer)
+
+    # 빈 응답/오류 응답은 Batch 요청에서 제외 (재조립 시 0점 처리)
+    scorable = {q_id: test_case for q_id, test_case in test_cases.items() if not is_unscorable(test_case.actual_output)}
+
+    batch_results = {}
+    if scorable:
+        batch_path = write_batch_requests(scorable)
+
+        client = genai.Client(api_key=os.getenv("EVAL_GEMINI_API_KEY") or os.getenv("GOOGLE_API_KEY"))
+        job = submit_batch_job(client, batch_path)
+        console.print(f"📤 Batch 작업 제출 완료: [bold yellow]{job.name}[/bold yellow] ({len(scorable) * len(JUDGE_METRICS)}건 요청)")
+
+        # 2단계: 작업 완료 대기 후 결과 재조립
+        job = await wait_for_batch_job(client, job)
+        if job.state.name not in BATCH_SUCCESS_STATES:
+            console.print(f"[bold red]❌ Batch 작업이 실패했습니다: {job.state.name} ({job.error})[/bold red]")
+            return
+
+        batch_results = parse_batch_results(client.files.download(file=job.dest.file_name))
+
+    entries = []
+    raw = np.zeros((len(eval_subset), len(METRIC_NAMES)), dtype=np.float32)
+    for idx, data in enumerate(eval_subset):
+        q_id = str(data.get("id", idx))
+        if q_id in scorable:
+            metric_results = batch_results.get(q_id, {})
+            # 로컬 메트릭은 Batch 작업 없이 직접 계산
+            metric_results.update(await asyncio.to_thread(score_local_metrics, test_cases[q_id]))
+        else:
+            metric_results = {name: (0.0, UNSCORABLE_REASON) for name in METRICS}
+        if len(metric_results) != len(METRICS):
+            console.print(f"[bold red]❌ 채점 결과 누락 (문항 {idx+1}): {sorted(set(METRICS) - set(metric_results))}[/bold red]")
+            continue
+
+        raw[len(entries)] = [metric_results[name][0] for name in METRIC_NAMES]
+        entries.append((q_id, data, test_cases[q_id].actual_output, {name: reason for name, (_, reason) in metric_results.items()}))
+
+    results_log, scaled = build_results_log(entries, raw[:len(entries)])
+    report_results(results_log, scaled)
+    persist_results(results_log)
+
+async def _aclose_agent_clients():
+    """에이전트 모듈(backend.main)의 Gemini/Supabase 연결 풀을 닫습니다. (import가 끝나지 않았다면 요청도 없었으므로 생략)"""
+    if _agent_task is None or not _agent_task.done() or _agent_task.cancelled() or _agent_task.exception():
+        return
+    agent = sys.modules["backend.main"]
+    await agent.llm_http_client.aclose()
+    if agent.db_client is not None:
+        await agent.db_client.aclose()
+
+async def run(batch: bool):
+    try:
+        await (main_batch() if batch else main())
+    finally:
+        # 공유 HTTP/2 연결 풀은 이벤트 루프가 살아 있을 때 닫아야 함
+        await aclose_http_client()
+        await _aclose_agent_clients()
+
 if __name__ == "__main__":
-    asyncio.run(main())
+    # --batch: Gemini Batch API로 오프라인 일괄 채점 (결과 수신까지 수 분~수 시간 소요)
+    asyncio.run(run("--batch" in sys.argv))
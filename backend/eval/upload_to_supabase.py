@@ -1,5 +1,5 @@
-import json
 import os
+import orjson
 from supabase import create_client, Client
 from dotenv import load_dotenv
 
@@ -15,10 +15,14 @@ if not SUPABASE_URL or not SUPABASE_KEY:
 
 supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
 
+# PostgREST 요청 크기/파라미터 제한을 넘지 않도록 나눠서 insert 할 행 수
+BATCH_SIZE = int(os.getenv("SUPABASE_BATCH", 500))
+
 def load_json_data(filepath: str) -> list:
+    # 파일을 bytes로 한 번에 읽어 orjson으로 디코딩 (json.load 대비 수 배 빠름)
     if os.path.exists(filepath):
-        with open(filepath, "r", encoding="utf-8") as f:
-            return json.load(f)
+        with open(filepath, "rb") as f:
+            return orjson.loads(f.read())
     return []
 
 def main():
@@ -54,12 +58,26 @@ def main():
         print("🗑️ DB의 기존 평가 데이터셋을 모두 삭제합니다...")
         # Supabase Python 클라이언트에서는 필터 없이 전체 삭제가 불안정할 수 있으므로 팩트가 일치하는 광범위한 조건 사용
         supabase.table("evaluation_dataset").delete().neq("question", "dummy_never_exists").execute()
-
-        # Supabase bulk insert
-        response = supabase.table("evaluation_dataset").insert(combined_data).execute()
-        print(f"✅ 총 {len(combined_data)}개의 데이터가 'evaluation_dataset' 테이블에 성공적으로 업로드되었습니다.")
     except Exception as e:
-        print(f"❌ 데이터베이스 업로드 중 오류 발생: {e}")
+        print(f"❌ 기존 데이터 삭제 중 오류 발생: {e}")
+        return
+
+    # Supabase bulk insert (BATCH_SIZE 단위로 분할, 실패한 청크는 1회 재시도 후 건너뜀)
+    uploaded = 0
+    for offset in range(0, len(combined_data), BATCH_SIZE):
+        chunk = combined_data[offset:offset + BATCH_SIZE]
+        for attempt in range(2):
+            try:
+                supabase.table("evaluation_dataset").insert(chunk).execute()
+                uploaded += len(chunk)
+                break
+            except Exception as e:
+                if attempt == 0:
+                    print(f"⚠️ {offset}~{offset + len(chunk) - 1}번 행 업로드 실패, 재시도합니다: {e}")
+                else:
+                    print(f"❌ {offset}~{offset + len(chunk) - 1}번 행 업로드 실패 (건너뜀): {e}")
+
+    print(f"✅ 총 {len(combined_data)}개 중 {uploaded}개의 데이터가 'evaluation_dataset' 테이블에 성공적으로 업로드되었습니다.")
 
 if __name__ == "__main__":
     main()
@@ -16,13 +16,18 @@ Billing AI Assistant - Backend API Server
 서버가 실행되면 http://localhost:8000/docs 에서 Swagger UI를 확인할 수 있습니다.
 """
 import os
+import orjson
+import asyncio
 import uvicorn
 import logging
+import httpx
+from contextlib import asynccontextmanager
+from cachetools import TTLCache
 from datetime import datetime
+from collections import OrderedDict
 from typing import TypedDict, Annotated, List, Optional
 from pydantic import BaseModel, Field
 import operator
-from supabase import create_client, Client
 from dotenv import load_dotenv
 
 # 로깅 설정
@@ -33,14 +38,29 @@ logger = logging.getLogger(__name__)
 logging.getLogger("httpx").setLevel(logging.WARNING)
 logging.getLogger("httpcore").setLevel(logging.WARNING)
 
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from langgraph.graph import StateGraph, START, END
+from langgraph.types import Send
 from langgraph.checkpoint.memory import MemorySaver
 from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain_core.messages import SystemMessage, HumanMessage, AIMessage, BaseMessage, ToolMessage
+from langchain_google_genai.chat_models import ChatGoogleGenerativeAIError
+from google import genai
+from google.genai import errors as genai_errors
+from langchain_core.messages import SystemMessage, HumanMessage, AIMessage, AIMessageChunk, BaseMessage, ToolMessage, trim_messages
 from langchain_core.tools import tool
 
+# 외부 연동 실패를 구분하는 예외 (FastAPI 예외 핸들러가 타입으로 HTTP 상태 코드를 결정)
+class LLMError(Exception):
+    """Gemini 호출 실패"""
+
+class LLMRateLimitError(LLMError):
+    """Gemini 할당량 초과/요청 제한 (429)"""
+
+class DBError(Exception):
+    """Supabase(PostgREST) 호출 실패"""
+
 # ─────────────────────────────────────────
 # 1. 환경 변수 로드 및 Supabase 초기화
 # ─────────────────────────────────────────
@@ -49,10 +69,110 @@ load_dotenv()
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_KEY = os.getenv("SUPABASE_KEY")
 
+# supabase-py 동기 클라이언트 대신 PostgREST 엔드포인트를 직접 호출하는 비동기 클라이언트
+# (요청 간 keep-alive 연결 재사용, 도구 호출 시 스레드풀을 점유하지 않음)
 if SUPABASE_URL and SUPABASE_KEY:
-    supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+    db_client = httpx.AsyncClient(
+        base_url=f"{SUPABASE_URL}/rest/v1",
+        headers={"apikey": SUPABASE_KEY, "Authorization": f"Bearer {SUPABASE_KEY}"},
+        http2=True,
+        limits=httpx.Limits(max_keepalive_connections=32),
+        timeout=10
+    )
 else:
-    supabase = None
+    db_client = None
+
+# billing_history 행의 details 캐시 ((user_id, billing_month) -> details, 60초 TTL)
+# 조회 도구들이 같은 행을 반복 조회하지 않도록 공유하며, change_subscription_plan이 행을 수정하면 즉시 무효화
+_row_cache = TTLCache(maxsize=1024, ttl=60)
+
+# 여러 /chat 요청의 details 조회를 모아 한 번의 IN 쿼리로 보내기 위한 대기 시간 (초)
+DETAILS_BATCH_WINDOW = 0.005
+
+# 진행 중인 details 조회 ((user_id, billing_month) -> Future), 같은 키의 동시 조회를 하나의 요청으로 합치는 용도
+_inflight_details: dict = {}
+
+# 다음 배치 쿼리에 실릴 조회 ((user_id, billing_month) -> Future)
+_pending_details: dict = {}
+
+# 실행 중인 배치 태스크 (이벤트 루프는 태스크를 약한 참조로만 들고 있으므로 완료 전 GC되지 않도록 보관)
+_batch_tasks: set = set()
+
+def _in_filter(values) -> str:
+    # PostgREST in 필터 (값에 쉼표/괄호가 있어도 안전하도록 큰따옴표로 감쌈)
+    return "in.(" + ",".join(f'"{value}"' for value in sorted(set(values))) + ")"
+
+async def _select_details(keys: list) -> dict:
+    try:
+        response = await db_client.get("/billing_history", params={
+            "select": "user_id,billing_month,details",
+            "user_id": _in_filter(user_id for user_id, _ in keys),
+            "billing_month": _in_filter(month for _, month in keys)
+        })
+        response.raise_for_status()
+    except httpx.HTTPError as e:
+        raise DBError(f"billing_history 조회 실패: {e}") from e
+    # user_id × billing_month 조합 중 요청하지 않은 행이 섞일 수 있으므로 요청한 키만 추림
+    wanted = set(keys)
+    found = {}
+    for row in orjson.loads(response.content):
+        key = (row["user_id"], row["billing_month"])
+        if key in wanted:
+            found[key] = row["details"]
+    return found
+
+async def _load_details_batch():
+    await asyncio.sleep(DETAILS_BATCH_WINDOW)
+    batch = dict(_pending_details)
+    _pending_details.clear()
+    try:
+        found = await _select_details(list(batch))
+    except Exception as e:
+        for future in batch.values():
+            if not future.done():
+                future.set_exception(e)
+    else:
+        for key, future in batch.items():
+            # 조회 도중 _invalidate_details로 무효화된 키(등록된 Future가 바뀜)는 이전 값일 수 있으므로 캐시하지 않음
+            if key in found and _inflight_details.get(key) is future:
+                _row_cache[key] = found[key]
+            if not future.done():
+                future.set_result(found.get(key))
+    finally:
+        for key, future in batch.items():
+            if _inflight_details.get(key) is future:
+                del _inflight_details[key]
+
+def _invalidate_details(user_id: str, month: str):
+    """행이 수정된 뒤 캐시된 details와 이미 전송된(수정 전 값을 읽었을 수 있는) 조회를 무효화합니다."""
+    key = (user_id, month)
+    _row_cache.pop(key, None)
+    future = _inflight_details.get(key)
+    # 아직 전송되지 않은 조회는 수정 후 값을 읽으므로 그대로 두고, 전송된 조회만 분리하여 이후 조회가 새로 요청하도록 함
+    if future is not None and _pending_details.get(key) is not future:
+        del _inflight_details[key]
+
+async def _get_details(user_id: str, month: str) -> Optional[dict]:
+    """
+    billing_history 행의 details를 조회합니다. (행이 없으면 None)
+    캐시 미스인 조회는 DETAILS_BATCH_WINDOW 동안 모아 한 번의 IN 쿼리로 가져오므로,
+    동시에 들어온 여러 /chat 요청의 조회(같은 키는 하나로 합쳐짐)가 DB 요청 하나로 처리됩니다.
+    """
+    key = (user_id, month)
+    if key in _row_cache:
+        return _row_cache[key]
+
+    future = _inflight_details.get(key)
+    if future is None:
+        loop = asyncio.get_running_loop()
+        future = _inflight_details[key] = _pending_details[key] = loop.create_future()
+        # 배치의 첫 조회가 배치 쿼리를 예약
+        if len(_pending_details) == 1:
+            task = loop.create_task(_load_details_batch())
+            _batch_tasks.add(task)
+            task.add_done_callback(_batch_tasks.discard)
+    # 한 호출자가 취소되더라도 공유 중인 조회는 취소되지 않도록 shield
+    return await asyncio.shield(future)
 
 # ─────────────────────────────────────────
 # 2. 요금 계산 Tool 정의
@@ -66,6 +186,14 @@ PLAN_PRICES = {
     "enterprise": None,
 }
 
+# 대소문자 구분 없는 요금제 → 월 요금 조회 테이블 (import 시 한 번만 생성)
+_PRICE_LUT = {name.casefold(): price for name, price in PLAN_PRICES.items()}
+
+# 예산 추천에 쓰이는 요금 상수
+LITE_PRICE = PLAN_PRICES["라이트"]
+PRO_PRICE = PLAN_PRICES["프로"]
+PRO_UPGRADE_DELTA = PRO_PRICE - LITE_PRICE
+
 class PlanUsage(BaseModel):
     plan: str = Field(description="요금제 이름. '라이트', '프로', '엔터프라이즈' 중 하나.")
     months: int = Field(description="해당 요금제를 사용한 개월 수")
@@ -87,7 +215,7 @@ def calculate_billing(plans: List[PlanUsage]) -> str:
     for item in plans:
         plan_name = item.plan
         months = item.months
-        price = PLAN_PRICES.get(plan_name.lower(), PLAN_PRICES.get(plan_name))
+        price = _PRICE_LUT.get(plan_name.casefold())
         if price is None:
             lines.append(f"- {plan_name} {months}개월: 별도 문의 (엔터프라이즈)")
         else:
@@ -102,15 +230,14 @@ class BillingHistoryInput(BaseModel):
     month: str = Field(description="조회할 연월 (형식: 'YYYY-MM', 예: '2026-02')")
 
 @tool(args_schema=BillingHistoryInput)
-def fetch_billing_history(user_id: str, month: str) -> str:
+async def fetch_billing_history(user_id: str, month: str) -> str:
     """사용자의 특정 월 요금 청구 내역(DB)을 조회합니다."""
-    if not supabase:
+    if not db_client:
         return "시스템 오류: 데이터베이스에 연결할 수 없습니다."
     
     try:
-        response = supabase.table("billing_history").select("details").eq("user_id", user_id).eq("billing_month", month).execute()
-        if response.data:
-            details = response.data[0]["details"]
+        details = await _get_details(user_id, month)
+        if details is not None:
             return (
                 f"[{user_id} 님의 {month} 청구 상세 내역]\n"
                 f"- 기본료: {details.get('base_fee', 0):,}원\n"
@@ -121,32 +248,18 @@ def fetch_billing_history(user_id: str, month: str) -> str:
             )
         else:
             return f"{user_id} 님의 {month} 청구 내역이 존재하지 않습니다."
+    except DBError:
+        # DB 장애는 도구 결과 문자열로 삼키지 않고 503 응답으로 전달
+        raise
     except Exception as e:
         logger.error(f"DB 데이터 조회 중 오류 발생: {e}")
         return f"요금 내역 조회 중 오류 발생: {e}"
 
-def classify_error(error_msg: str) -> tuple[str, int]:
-    """오류 메시지를 분석하여 에러 코드와 HTTP 상태 코드를 반환"""
-    error_code = "PROCESSING_ERROR"
-    status_code = 500
-    
-    error_msg_lower = error_msg.lower()
-    
-    if "api" in error_msg_lower or "gemini" in error_msg_lower:
-        error_code = "API_ERROR"
-        if "quota" in error_msg_lower or "rate limit" in error_msg_lower:
-            status_code = 429
-    elif "supabase" in error_msg_lower or "database" in error_msg_lower:
-        error_code = "DATABASE_ERROR"
-        status_code = 503
-        
-    return error_code, status_code
-
 @tool(args_schema=RecommendInput)
 def recommend_plan_by_budget(budget: int, months: int = 12) -> str:
     """사용자의 예산과 기간에 맞춤화된 요금제 조합을 추천합니다."""
-    lite_total = PLAN_PRICES["라이트"] * months
-    pro_total = PLAN_PRICES["프로"] * months
+    lite_total = LITE_PRICE * months
+    pro_total = PRO_PRICE * months
     recommendations = [f"입력하신 예산 {budget:,}원 ({months}개월 기준) 추천안입니다:"]
     
     if budget >= pro_total:
@@ -154,14 +267,13 @@ def recommend_plan_by_budget(budget: int, months: int = 12) -> str:
     elif budget >= lite_total:
         recommendations.append(f"✅ [Lite 추천] {months}개월 동안 안정적으로 기본 기능을 이용하실 수 있습니다. (총 {lite_total:,}원)")
         extra_budget = budget - lite_total
-        pro_upgrade_cost = PLAN_PRICES["프로"] - PLAN_PRICES["라이트"]
-        upgrade_months = extra_budget // pro_upgrade_cost
+        upgrade_months = extra_budget // PRO_UPGRADE_DELTA
         if upgrade_months > 0:
             # 기간(months)을 초과하지 않도록 제한
             actual_upgrade_months = min(upgrade_months, months)
             recommendations.append(f"💡 [하이브리드안] 라이트 요금제를 기본으로 쓰시되, 중요한 프로젝트가 있는 {actual_upgrade_months}개월 동안은 프로로 업그레이드하셔도 예산 내에 들어옵니다.")
     else:
-        possible_months = budget // PLAN_PRICES["라이트"]
+        possible_months = budget // LITE_PRICE
         if possible_months > 0:
             recommendations.append(f"⚠️ 라이트 요금제를 최대 {possible_months}개월 동안 이용하실 수 있습니다. 요청하신 {months}개월을 모두 쓰시기에는 예산이 조금 부족하네요.")
         else:
@@ -174,15 +286,14 @@ class OverageInput(BaseModel):
     month: str = Field(description="조회할 연월 (형식: 'YYYY-MM', 예: '2026-02')")
 
 @tool(args_schema=OverageInput)
-def analyze_overage_cause(user_id: str, month: str) -> str:
+async def analyze_overage_cause(user_id: str, month: str) -> str:
     """특정 월의 요금 초과 사유를 분석하기 위해 DB에서 시스템 로그 데이터를 조회합니다."""
-    if not supabase:
+    if not db_client:
         return "시스템 오류: 데이터베이스에 연결할 수 없습니다."
     
     try:
-        response = supabase.table("billing_history").select("details").eq("user_id", user_id).eq("billing_month", month).execute()
-        if response.data:
-            details = response.data[0]["details"]
+        details = await _get_details(user_id, month)
+        if details is not None:
             # DB의 details 컬럼 내에 저장된 로그성 데이터들을 추출
             logs = {
                 "usage_stats": details.get("usage_stats", "기록 없음"),
@@ -192,6 +303,9 @@ def analyze_overage_cause(user_id: str, month: str) -> str:
             return f"[{user_id} 님의 {month} 시스템 활동 로그 보고서]\n{logs}"
         else:
             return f"{user_id} 님의 {month} 청구 기록이 없어 분석이 불가능합니다."
+    except DBError:
+        # DB 장애는 도구 결과 문자열로 삼키지 않고 503 응답으로 전달
+        raise
     except Exception as e:
         logger.error(f"로그 데이터 조회 중 오류 발생: {e}")
         return f"로그 데이터 조회 중 오류 발생: {e}"
@@ -203,10 +317,10 @@ class ChangePlanInput(BaseModel):
     start_month: Optional[str] = Field(default=None, description="'specific_month' 적용 방식일 경우, 적용을 시작할 연월 (형식: 'YYYY-MM', 예: '2026-04')")
 
 @tool(args_schema=ChangePlanInput)
-def change_subscription_plan(user_id: str, target_plan: str, apply_type: str, start_month: Optional[str] = None) -> str:
+async def change_subscription_plan(user_id: str, target_plan: str, apply_type: str, start_month: Optional[str] = None) -> str:
     """사용자의 구독 요금제를 변경하거나 변경을 예약합니다."""
-    # DB 업데이트 로직 (supabase 연동)
-    if not supabase:
+    # DB 업데이트 로직 (supabase PostgREST 연동)
+    if not db_client:
         return "시스템 오류: 데이터베이스에 연결할 수 없어 변경을 처리할 수 없습니다."
         
     current_month_str = datetime.now().strftime("%Y-%m")
@@ -215,17 +329,32 @@ def change_subscription_plan(user_id: str, target_plan: str, apply_type: str, st
     status = "active" if apply_type == "immediate" else "pending_change"
     
     try:
-        # 1. 이번 달 상태부터 먼저 조회하여 히스토리 저장을 위한 이전 요금제 파악 (details 컬럼 추가)
-        response = supabase.table("billing_history").select("billing_month, subscription_info, details").eq("user_id", user_id).execute()
-        
-        if not response.data:
+        # 1. 변경 대상 월 조건을 PostgREST 필터로 변환 (문자열 크기 비교로 미래 달인지 확인, 예: '2026-03' > '2026-02')
+        if apply_type == "immediate":
+            target_filter = f"gte.{current_month_str}"
+        elif apply_type == "next_billing":
+            target_filter = f"gt.{current_month_str}"
+        elif apply_type == "specific_month" and start_month:
+            target_filter = f"gte.{start_month}"
+        else:
+            target_filter = None
+
+        # 이번 달 행(이전 요금제 파악용)과 변경 대상 월 행만 서버에서 걸러서 동시에 조회
+        select_columns = "billing_month,subscription_info,details"
+        requests = [db_client.get("/billing_history", params={"select": select_columns, "user_id": f"eq.{user_id}", "billing_month": f"eq.{current_month_str}"})]
+        if target_filter:
+            requests.append(db_client.get("/billing_history", params={"select": select_columns, "user_id": f"eq.{user_id}", "billing_month": target_filter}))
+        responses = await asyncio.gather(*requests)
+        for response in responses:
+            response.raise_for_status()
+
+        current_rows = orjson.loads(responses[0].content)
+        months_to_update = orjson.loads(responses[1].content) if target_filter else []
+        if not current_rows and not months_to_update:
             return f"사용자 [{user_id}]의 청구 데이터가 없습니다."
-            
-        # 모든 월 데이터를 가져옴
-        all_months_data = response.data
         
         # 이번 달의 현재 정보 찾기 (없으면 대체값)
-        current_month_data = next((item for item in all_months_data if item["billing_month"] == current_month_str), None)
+        current_month_data = current_rows[0] if current_rows else None
         
         current_info = {}
         previous_plan = "알 수 없음"
@@ -240,23 +369,12 @@ def change_subscription_plan(user_id: str, target_plan: str, apply_type: str, st
             "target_plan": target_plan,
             "apply_type": apply_type
         }
-        
-        # 3. 업데이트할 타겟 달 결정
-        months_to_update = []
-        for item in all_months_data:
-            b_month = item["billing_month"]
-            # 문자열 크기 비교로 미래 달인지 확인 (예: '2026-03' > '2026-02')
-            if apply_type == "immediate" and b_month >= current_month_str:
-                months_to_update.append(item)
-            elif apply_type == "next_billing" and b_month > current_month_str:
-                months_to_update.append(item)
-            elif apply_type == "specific_month" and start_month and b_month >= start_month:
-                months_to_update.append(item)
                 
         # 변경될 요금제의 기본 요금 확인 (PLAN_PRICES 참조)
-        new_base_fee = PLAN_PRICES.get(target_plan.lower(), PLAN_PRICES.get(target_plan))
+        new_base_fee = _PRICE_LUT.get(target_plan.casefold())
         
-        # 4. 루프 돌면서 해당 달 업데이트 (Bulk update가 지원 안 되므로 개별 update)
+        # 4. 루프 돌면서 해당 달의 변경 행을 만들고, 마지막에 한 번의 RPC 호출로 반영
+        updated_rows = []
         for item in months_to_update:
             b_month = item["billing_month"]
             
@@ -285,11 +403,12 @@ def change_subscription_plan(user_id: str, target_plan: str, apply_type: str, st
                 "change_history": change_history # 변경 이력 배열 추가
             })
             
-            # DB의 billing_history 테이블에서 해당 월의 행 업데이트 (subscription_info + details 동시 업데이트)
-            supabase.table("billing_history").update({
+            # 해당 월 행의 subscription_info + details 동시 업데이트
+            updated_rows.append({
+                "billing_month": b_month,
                 "subscription_info": new_subscription_info,
                 "details": details # 요금이 변경된 details 반영
-            }).eq("user_id", user_id).eq("billing_month", b_month).execute()
+            })
             
             # 주의: 만약 'next_billing' 이라면 이번 달('current_month_str')의 상태도 
             # 'pending_change'로 업데이트해야 함. (위에 for문에서는 제외됐으므로 별도 처리)
@@ -309,9 +428,23 @@ def change_subscription_plan(user_id: str, target_plan: str, apply_type: str, st
                 "change_history": c_history
             })
             
-            supabase.table("billing_history").update({
-                "subscription_info": new_c_info
-            }).eq("user_id", user_id).eq("billing_month", current_month_str).execute()
+            # details가 null이면 RPC가 기존 값을 유지 (이번 달 요금은 변경하지 않음)
+            updated_rows.append({
+                "billing_month": current_month_str,
+                "subscription_info": new_c_info,
+                "details": None
+            })
+
+        # 5. 변경 행 전체를 한 번의 RPC 호출(단일 트랜잭션)로 반영 (backend/sql/bulk_update_subscription.sql)
+        if updated_rows:
+            rpc_response = await db_client.post(
+                "/rpc/bulk_update_subscription",
+                content=orjson.dumps({"p_user_id": user_id, "p_rows": updated_rows}),
+                headers={"Content-Type": "application/json"}
+            )
+            rpc_response.raise_for_status()
+            for row in updated_rows:
+                _invalidate_details(user_id, row["billing_month"])
         
         if apply_type == "immediate":
             return f"✅ [{user_id}] 님의 요금제가 ({current_month_str}월 포함 이후 모든 월) 즉시 '{previous_plan}'에서 '{target_plan}'(으)로 일괄 변경 업데이트 되었습니다."
@@ -320,6 +453,9 @@ def change_subscription_plan(user_id: str, target_plan: str, apply_type: str, st
         else:
             return f"📅 [{user_id}] 님의 요금제가 (다음 달부터 이후 모든 월) 결제일 기준으로 '{previous_plan}'에서 '{target_plan}'(으)로 일괄 변경 예약되었습니다."
             
+    except httpx.HTTPError as e:
+        # DB 장애는 도구 결과 문자열로 삼키지 않고 503 응답으로 전달
+        raise DBError(f"billing_history 변경 실패: {e}") from e
     except Exception as e:
         logger.error(f"요금제 일괄 변경 업데이트 중 오류 발생: {e}")
         return f"요금제 변경을 처리하는 중 연동 오류가 발생했습니다: {e}"
@@ -330,47 +466,199 @@ def change_subscription_plan(user_id: str, target_plan: str, apply_type: str, st
 class State(TypedDict):
     messages: Annotated[List[BaseMessage], operator.add]
 
+# SYSTEM_PROMPT 부분 수정
+current_date = datetime.now().strftime("%Y-%m-%d")
+
+SYSTEM_PROMPT = f"""
+You are a professional and friendly AI Billing Assistant. 
+The current system date is {current_date}. If a user mentions a month without a year (e.g., 'February'), use this current year as the default.
+
+[Service Information]
+- Lite: 9,900 KRW/month | Personal | Basic analysis, Chat support, 100 API calls
+- Pro: 29,900 KRW/month | Professional/Teams | Advanced visualization, Priority support, 1,000 API calls
+- Enterprise: Inquire separately | Corporate | Custom API, Dedicated manager, Unlimited calls
+
+[Payment Methods]
+- Credit Cards: All major domestic/international cards (Visa, Master, Hyundai, Samsung, etc.)
+- Easy Payment: KakaoPay, NaverPay, ApplePay
+- Others: Bank transfer (Corporate only), Automatic debit setup available
+
+[User Context]
+- The authenticated ID of the current customer is 'user_123'.
+- Always use 'user_123' as the user_id when calling 'fetch_billing_history'.
+
+[Strict Operational Guidelines]
+1. **RESPONSE LANGUAGE**: ALWAYS respond to the user in **KOREAN**.
+2. **BILLING & OVERAGE INQUIRIES**: If the user asks about their billing amounts, comparisons, OR WHY their bill is high, you MUST trigger BOTH `fetch_billing_history` AND `analyze_overage_cause` tools. Do not skip either.
+3. **NO INTERMEDIATE REPLIES**: NEVER send intermediate messages like "잠시만 기다려 주세요" or "조회해 보겠습니다". Call the required tools simultaneously, gather all data, and provide ONLY ONE final, complete answer.
+4. **RECOMMENDATION**: Call `recommend_plan_by_budget` immediately if the user asks for budget advice or plan recommendations.
+5. **CALCULATION**: Use `calculate_billing` for multi-plan cost estimations.
+6. **FORMATTING**: When providing details for a **specific single month** from `fetch_billing_history`, always emphasize the total with **'💰 총 청구 금액: [Amount]원'** at the very end of the response. For multi-month calculations (averages, totals), provide the summary clearly in the text and skip the redundant footer if the total has already been emphasized.
+7. Base your final response strictly on the data analysis results from the tools.
+8. **ENTERPRISE INQUIRIES**: You are fully authorized to explain the features of the Enterprise plan (Custom API, Dedicated manager, Unlimited calls) based on the [Service Information]. NEVER state that answering about the Enterprise plan is outside your scope.
+"""
+
+# import 시 한 번만 생성하여 모든 스레드/턴에서 재사용
+SYSTEM_MESSAGE = SystemMessage(content=SYSTEM_PROMPT)
+
+# LLM 호출 시 전달할 대화 히스토리 최대 토큰 수 (대화가 길어져도 턴당 입력 토큰/지연이 일정하도록 제한)
+MAX_HISTORY_TOKENS = int(os.getenv("MAX_HISTORY_TOKENS", 4000))
+
 tools = [calculate_billing, recommend_plan_by_budget, fetch_billing_history, analyze_overage_cause, change_subscription_plan]
+
+# Gemini 호출 전용 HTTP/2 비동기 연결 풀
+# 동시 요청을 하나의 연결로 멀티플렉싱하고 keep-alive로 재사용하여 LLM 호출마다 TCP/TLS 핸드셰이크가 반복되지 않도록 함
+llm_http_client = httpx.AsyncClient(
+    http2=True,
+    limits=httpx.Limits(max_connections=64, max_keepalive_connections=64)
+)
+
+def _with_http_client(client: genai.Client, http_client: httpx.AsyncClient) -> genai.Client:
+    """
+    langchain_google_genai가 구성한 google-genai 클라이언트를 공유 httpx 비동기 클라이언트를 쓰는 클라이언트로 교체합니다.
+    (langchain_google_genai는 httpx 클라이언트 주입을 노출하지 않음)
+    base_url, client_args, 헤더(User-Agent, x-goog-api-client 등)는 기존 클라이언트의 http_options를 그대로 복사하고,
+    인증은 기존 클라이언트가 확정한 값(API 키 또는 Vertex AI 자격 증명/ADC)을 사용합니다.
+    """
+    api_client = client._api_client
+    http_options = api_client._http_options.model_copy(update={"httpx_async_client": http_client})
+    if api_client.api_key:
+        auth = {"api_key": api_client.api_key}
+    else:
+        auth = {"credentials": api_client._credentials, "project": api_client.project, "location": api_client.location}
+    shared = genai.Client(vertexai=api_client.vertexai, http_options=http_options, **auth)
+    # 기존 클라이언트의 동기 연결 풀을 닫음 (비동기 풀은 요청 전이라 열린 연결이 없음)
+    client.close()
+    return shared
+
 llm = ChatGoogleGenerativeAI(model="gemini-2.5-flash")
+llm.client = _with_http_client(llm.client, llm_http_client)
 llm_with_tools = llm.bind_tools(tools)
 tool_map = {t.name: t for t in tools}
 
-def billing_agent(state: State):
-    response = llm_with_tools.invoke(state["messages"])
+async def billing_agent(state: State):
+    # 최근 대화만 남기되, 도구 호출/응답 쌍이 잘리지 않도록 사용자 메시지부터 시작
+    history = trim_messages(
+        state["messages"],
+        max_tokens=MAX_HISTORY_TOKENS,
+        token_counter="approximate",
+        strategy="last",
+        start_on="human"
+    )
+    if not history:
+        # 현재 턴만으로 한도를 넘는 경우 현재 턴(마지막 사용자 메시지 이후)은 그대로 전달
+        last_human = max(i for i, m in enumerate(state["messages"]) if isinstance(m, HumanMessage))
+        history = state["messages"][last_human:]
+
+    # 시스템 프롬프트는 스레드 상태(체크포인트)에 저장하지 않고 매 호출 시 system instruction으로만 전달
+    try:
+        response = await llm_with_tools.ainvoke([SYSTEM_MESSAGE] + history)
+    except (ChatGoogleGenerativeAIError, genai_errors.APIError, httpx.HTTPError) as e:
+        # langchain_google_genai는 4xx 오류를 감싸서 던지므로 원인 예외의 상태 코드로 요청 제한 여부를 판단
+        cause = e.__cause__ if isinstance(e.__cause__, genai_errors.APIError) else e
+        if isinstance(cause, genai_errors.APIError) and cause.code == 429:
+            raise LLMRateLimitError(str(e)) from e
+        raise LLMError(str(e)) from e
     return {"messages": [response]}
 
-def tool_executor(state: State):
+class ToolCallState(TypedDict):
+    tool_call: dict
+    # 같은 (도구, 인자)로 중복 요청된 tool_call_id 목록 (tool_call 자신 포함)
+    tool_call_ids: List[str]
+
+def route_tools(state: State):
     last_message = state["messages"][-1]
-    tool_results = []
+    if not (hasattr(last_message, "tool_calls") and last_message.tool_calls):
+        return END
+
+    # 같은 (도구, 인자) 호출이 중복되면 한 번만 실행하고 결과를 각 tool_call_id에 공유
+    unique_calls = {}
     for tool_call in last_message.tool_calls:
-        tool_name = tool_call["name"]
-        tool_args = tool_call["args"]
-        result = tool_map[tool_name].invoke(tool_args)
-        tool_results.append(
-            ToolMessage(content=str(result), tool_call_id=tool_call["id"])
-        )
-    return {"messages": tool_results}
-
-def should_use_tool(state: State):
-    last_message = state["messages"][-1]
-    if hasattr(last_message, "tool_calls") and last_message.tool_calls:
-        return "tool_executor"
-    return END
+        key = (tool_call["name"], orjson.dumps(tool_call["args"], option=orjson.OPT_SORT_KEYS, default=str))
+        unique_calls.setdefault(key, {"tool_call": tool_call, "tool_call_ids": []})["tool_call_ids"].append(tool_call["id"])
+
+    # 한 턴의 도구 호출들은 서로 독립적이므로 Send로 run_tool 노드에 팬아웃하여 같은 superstep에서 병렬 실행
+    # (예: fetch_billing_history + analyze_overage_cause), 결과 ToolMessage는 messages 리듀서(operator.add)로 합쳐짐
+    return [Send("run_tool", call) for call in unique_calls.values()]
+
+async def run_tool(state: ToolCallState):
+    tool_call = state["tool_call"]
+    try:
+        result = await tool_map[tool_call["name"]].ainvoke(tool_call["args"])
+    except DBError:
+        # 예외 핸들러가 DATABASE_ERROR(503)로 응답하도록 그대로 전파
+        raise
+    except Exception as e:
+        logger.error(f"도구 실행 중 오류 발생 ({tool_call['name']}): {e}")
+        result = f"도구 실행 중 오류 발생: {e}"
+    return {"messages": [ToolMessage(content=str(result), tool_call_id=tool_call_id) for tool_call_id in state["tool_call_ids"]]}
 
 workflow = StateGraph(State)
 workflow.add_node("billing_assistant", billing_agent)
-workflow.add_node("tool_executor", tool_executor)
+workflow.add_node("run_tool", run_tool)
 workflow.add_edge(START, "billing_assistant")
-workflow.add_conditional_edges("billing_assistant", should_use_tool)
-workflow.add_edge("tool_executor", "billing_assistant")
-
-memory = MemorySaver()
+workflow.add_conditional_edges("billing_assistant", route_tools, ["run_tool", END])
+workflow.add_edge("run_tool", "billing_assistant")
+
+class BoundedMemorySaver(MemorySaver):
+    """
+    최근 사용한 thread_id를 최대 max_threads개까지만 보관하는 인메모리 체크포인터.
+    한도를 넘으면 가장 오래 사용되지 않은 스레드의 체크포인트를 삭제하여 대화 수에 따른 프로세스 메모리 증가를 제한합니다.
+    MemorySaver.delete_thread는 전체 스레드의 writes/blobs 키를 훑으므로, 해당 스레드의 키만 찾아 삭제합니다.
+    """
+    def __init__(self, max_threads: int):
+        super().__init__()
+        self.max_threads = max_threads
+        self._recent_threads: OrderedDict = OrderedDict()
+        # thread_id -> 이 스레드가 저장한 blobs 키 목록
+        self._blob_keys: dict = {}
+
+    def get_tuple(self, config):
+        thread_id = config["configurable"].get("thread_id")
+        if thread_id in self._recent_threads:
+            self._recent_threads.move_to_end(thread_id)
+        return super().get_tuple(config)
+
+    def put(self, config, checkpoint, metadata, new_versions):
+        saved_config = super().put(config, checkpoint, metadata, new_versions)
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"]["checkpoint_ns"]
+        self._blob_keys.setdefault(thread_id, set()).update((thread_id, checkpoint_ns, k, v) for k, v in new_versions.items())
+        self._recent_threads[thread_id] = None
+        self._recent_threads.move_to_end(thread_id)
+        while len(self._recent_threads) > self.max_threads:
+            stale_thread_id, _ = self._recent_threads.popitem(last=False)
+            self.delete_thread(stale_thread_id)
+        return saved_config
+
+    def delete_thread(self, thread_id: str) -> None:
+        # writes는 (thread_id, checkpoint_ns, checkpoint_id) 키의 defaultdict이며 get_tuple 조회만으로도 빈 항목이 생기므로,
+        # put_writes 기록이 아니라 이 스레드의 체크포인트 목록에서 키를 만들어 삭제
+        for checkpoint_ns, checkpoints in self.storage.pop(thread_id, {}).items():
+            for checkpoint_id in checkpoints:
+                self.writes.pop((thread_id, checkpoint_ns, checkpoint_id), None)
+        for key in self._blob_keys.pop(thread_id, ()):
+            self.blobs.pop(key, None)
+        self._recent_threads.pop(thread_id, None)
+
+# 프로세스당 보관할 최대 대화 스레드 수
+MAX_CHAT_THREADS = int(os.getenv("MAX_CHAT_THREADS", 10_000))
+
+memory = BoundedMemorySaver(max_threads=MAX_CHAT_THREADS)
 app_graph = workflow.compile(checkpointer=memory)
 
 # ─────────────────────────────────────────
 # 4. FastAPI 설정
 # ─────────────────────────────────────────
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    yield
+    # 서버 종료 시 DB/LLM 연결 풀 정리
+    if db_client:
+        await db_client.aclose()
+    await llm_http_client.aclose()
+
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -380,6 +668,26 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+ERROR_MESSAGE = "서버 처리 중 문제가 발생했습니다. (내부 로그 확인)"
+
+def _classify_exception(exc: Exception) -> tuple[str, int]:
+    """예외 타입으로 에러 코드와 HTTP 상태 코드를 결정"""
+    if isinstance(exc, LLMRateLimitError):
+        return "API_ERROR", 429
+    if isinstance(exc, LLMError):
+        return "API_ERROR", 502
+    if isinstance(exc, DBError):
+        return "DATABASE_ERROR", 503
+    return "PROCESSING_ERROR", 500
+
+@app.exception_handler(LLMError)
+@app.exception_handler(DBError)
+async def upstream_error_handler(request: Request, exc: Exception):
+    error_code, status_code = _classify_exception(exc)
+    logger.error(f"❌ 요청 처리 중 예외 발생 [{error_code}] {request.url.path}: {exc}")
+    # HTTP 에러 응답시 구체화된 에러코드와 메시지 전달
+    return JSONResponse(status_code=status_code, content={"detail": {"error_code": error_code, "message": ERROR_MESSAGE}})
+
 @app.get("/health")
 def health_check():
     """서버 상태 확인용 (Docker Liveness Probe 대응)"""
@@ -393,103 +701,156 @@ class MessageDict(BaseModel):
     role: str
     content: str
 
-# SYSTEM_PROMPT 부분 수정
-current_date = datetime.now().strftime("%Y-%m-%d")
-
-SYSTEM_PROMPT = f"""
-You are a professional and friendly AI Billing Assistant. 
-The current system date is {current_date}. If a user mentions a month without a year (e.g., 'February'), use this current year as the default.
-
-[Service Information]
-- Lite: 9,900 KRW/month | Personal | Basic analysis, Chat support, 100 API calls
-- Pro: 29,900 KRW/month | Professional/Teams | Advanced visualization, Priority support, 1,000 API calls
-- Enterprise: Inquire separately | Corporate | Custom API, Dedicated manager, Unlimited calls
-
-[Payment Methods]
-- Credit Cards: All major domestic/international cards (Visa, Master, Hyundai, Samsung, etc.)
-- Easy Payment: KakaoPay, NaverPay, ApplePay
-- Others: Bank transfer (Corporate only), Automatic debit setup available
-
-[User Context]
-- The authenticated ID of the current customer is 'user_123'.
-- Always use 'user_123' as the user_id when calling 'fetch_billing_history'.
-
-[Strict Operational Guidelines]
-1. **RESPONSE LANGUAGE**: ALWAYS respond to the user in **KOREAN**.
-2. **BILLING & OVERAGE INQUIRIES**: If the user asks about their billing amounts, comparisons, OR WHY their bill is high, you MUST trigger BOTH `fetch_billing_history` AND `analyze_overage_cause` tools. Do not skip either.
-3. **NO INTERMEDIATE REPLIES**: NEVER send intermediate messages like "잠시만 기다려 주세요" or "조회해 보겠습니다". Call the required tools simultaneously, gather all data, and provide ONLY ONE final, complete answer.
-4. **RECOMMENDATION**: Call `recommend_plan_by_budget` immediately if the user asks for budget advice or plan recommendations.
-5. **CALCULATION**: Use `calculate_billing` for multi-plan cost estimations.
-6. **FORMATTING**: When providing details for a **specific single month** from `fetch_billing_history`, always emphasize the total with **'💰 총 청구 금액: [Amount]원'** at the very end of the response. For multi-month calculations (averages, totals), provide the summary clearly in the text and skip the redundant footer if the total has already been emphasized.
-7. Base your final response strictly on the data analysis results from the tools.
-8. **ENTERPRISE INQUIRIES**: You are fully authorized to explain the features of the Enterprise plan (Custom API, Dedicated manager, Unlimited calls) based on the [Service Information]. NEVER state that answering about the Enterprise plan is outside your scope.
-"""
-
-@app.post("/chat", response_model=List[MessageDict])
-async def chat(request: ChatRequest):
+def _message_text(content) -> str:
+    # 리스트 형태의 응답에서 텍스트만 추출 (Gemini 등 대응)
+    if isinstance(content, str):
+        return content
+    if isinstance(content, list):
+        texts = []
+        for part in content:
+            if isinstance(part, dict) and part.get("type") == "text":
+                texts.append(part.get("text", ""))
+            elif isinstance(part, str):
+                texts.append(part)
+        return "".join(texts)
+    return str(content)
+
+# 프론트엔드에 전달하는 메시지 타입 → 역할 (System/Tool 메시지는 제외)
+_MESSAGE_ROLES = {HumanMessage: "user", AIMessage: "assistant", AIMessageChunk: "assistant"}
+
+def _current_turn(messages: List[BaseMessage]) -> List[BaseMessage]:
+    # 이번 요청의 사용자 메시지부터 끝까지 (뒤에서부터 찾으므로 대화 길이와 무관하게 이번 턴 길이만큼만 탐색)
+    for i in range(len(messages) - 1, -1, -1):
+        if type(messages[i]) is HumanMessage:
+            return messages[i:]
+    return messages
+
+def _build_history(messages: List[BaseMessage]) -> List[MessageDict]:
+    """이번 턴의 메시지(사용자 메시지 + 상담원 응답)만 정리 (프론트엔드 전달용)"""
+    turn = _current_turn(messages)
+    if not any(isinstance(m, AIMessage) for m in turn):
+        logger.error("❌ 오류: 워크플로우를 완료했지만 AI 응답이 없습니다.")
+        raise HTTPException(status_code=500, detail={"error_code": "EMPTY_RESPONSE", "message": "AI 응답을 생성하지 못했습니다."})
+
+    history = []
+    for m in turn:
+        role = _MESSAGE_ROLES.get(type(m))
+        if role is None or not m.content: continue # System/Tool 메시지, 빈 메시지(tool call 용) 제외
+
+        content = _message_text(m.content)
+
+        # 텍스트 내용이 없으면 (예: 도구 호출용 메시지) 스킵
+        if not content.strip():
+            continue
+
+        history.append(MessageDict(role=role, content=content))
+    return history
+
+def _chat_input(request: ChatRequest) -> tuple[dict, dict]:
     logger.info(f"💬 신규 채팅 요청 접수: thread_id={request.thread_id}, 내용='{request.message}'")
     config = {"configurable": {"thread_id": request.thread_id}}
-    
-    # 해당 스레드의 상태가 없으면 시스템 메시지로 초기화
-    state = app_graph.get_state(config)
-    if not state.values:
-        input_data = {"messages": [SystemMessage(content=SYSTEM_PROMPT), HumanMessage(content=request.message)]}
+    # 시스템 프롬프트는 billing_agent가 매 호출 시 붙이므로 사용자 메시지만 상태에 추가
+    input_data = {"messages": [HumanMessage(content=request.message)]}
+    return input_data, config
+
+async def _close_pending_tool_calls(config: dict) -> None:
+    """
+    그래프가 도구 실행 도중 예외로 중단되면 체크포인트 마지막 AIMessage의 tool_calls에 응답이 없는 채로 남아
+    다음 턴의 LLM 호출이 거부되므로, 남은 tool_call_id마다 ToolMessage를 기록해 대화를 닫습니다.
+    """
+    checkpoint = await app_graph.checkpointer.aget_tuple(config)
+    if checkpoint is None:
+        return
+    messages = checkpoint.checkpoint["channel_values"].get("messages", [])
+    for index in range(len(messages) - 1, -1, -1):
+        if isinstance(messages[index], AIMessage):
+            break
     else:
-        input_data = {"messages": [HumanMessage(content=request.message)]}
+        return
+
+    # 같은 superstep에서 먼저 끝난 run_tool의 결과는 체크포인트에 반영되지 않고 pending write로만 남아 있으므로 함께 기록
+    answered = {m.tool_call_id for m in messages[index + 1:] if isinstance(m, ToolMessage)}
+    tool_messages = []
+    for _, channel, value in checkpoint.pending_writes or ():
+        if channel == "messages":
+            for message in value:
+                if isinstance(message, ToolMessage) and message.tool_call_id not in answered:
+                    answered.add(message.tool_call_id)
+                    tool_messages.append(message)
+    tool_messages += [
+        ToolMessage(content="도구 실행 중 오류 발생: 데이터베이스에 연결할 수 없습니다.", tool_call_id=tool_call["id"])
+        for tool_call in messages[index].tool_calls if tool_call["id"] not in answered
+    ]
+    if not tool_messages:
+        return
+
+    # billing_assistant의 출력으로 기록하면 route_tools가 ToolMessage를 보고 END로 라우팅하므로 다음 실행 예정 노드가 남지 않음
+    await app_graph.aupdate_state(config, {"messages": tool_messages}, as_node="billing_assistant")
+
+def _sse(data, event: Optional[str] = None) -> str:
+    payload = orjson.dumps(data).decode()
+    return f"event: {event}\ndata: {payload}\n\n" if event else f"data: {payload}\n\n"
+
+@app.post("/chat")
+async def chat(request: ChatRequest):
+    """
+    응답을 Server-Sent Events로 스트리밍합니다.
+    - data: {"delta": "..."}  상담원 응답 토큰 (생성되는 대로 전송)
+    - event: done            이번 턴의 정리된 메시지 ([{"role", "content"}, ...], 사용자 메시지 포함)
+    - event: error           {"error_code", "status", "message"} (스트림 시작 후에는 HTTP 상태 코드를 바꿀 수 없으므로 이벤트로 전달)
+    """
+    input_data, config = _chat_input(request)
+
+    async def event_stream():
+        try:
+            async for event in app_graph.astream_events(input_data, config=config, version="v2"):
+                # 상담원 노드의 LLM 토큰만 전달 (도구 호출 청크는 텍스트가 비어 있으므로 제외)
+                if event["event"] == "on_chat_model_stream" and event["metadata"].get("langgraph_node") == "billing_assistant":
+                    delta = _message_text(event["data"]["chunk"].content)
+                    if delta:
+                        yield _sse({"delta": delta})
+
+            state = await app_graph.aget_state(config)
+            history = _build_history(state.values["messages"])
+            logger.info(f"✅ 채팅 처리 완료: thread_id={request.thread_id}")
+            yield _sse([m.model_dump() for m in history], event="done")
+        except HTTPException as e:
+            yield _sse({**e.detail, "status": e.status_code}, event="error")
+        except Exception as e:
+            error_code, status_code = _classify_exception(e)
+            logger.error(f"❌ 채팅 처리 중 예외 발생 [{error_code}]: {e} (thread_id={request.thread_id})")
+            if isinstance(e, DBError):
+                await _close_pending_tool_calls(config)
+            yield _sse({"error_code": error_code, "status": status_code, "message": ERROR_MESSAGE}, event="error")
+
+    # 프록시(nginx 등)가 이벤트를 모아서 보내지 않도록 버퍼링/캐시 비활성화
+    return StreamingResponse(event_stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.post("/chat/blocking", response_model=List[MessageDict])
+async def chat_blocking(request: ChatRequest):
+    """전체 응답이 완성된 뒤 이번 턴의 메시지를 한 번에 반환합니다. (스트리밍을 지원하지 않는 클라이언트용)"""
+    input_data, config = _chat_input(request)
 
     try:
-        final_state = app_graph.invoke(input_data, config=config)
-        
-        # 마지막 AI 메시지 추출
-        ai_msg = next((m for m in reversed(final_state["messages"]) if isinstance(m, AIMessage)), None)
-        
-        if not ai_msg:
-            logger.error(f"❌ 오류: 워크플로우를 완료했지만 AI 응답이 없습니다. (thread_id={request.thread_id})")
-            raise HTTPException(status_code=500, detail={"error_code": "EMPTY_RESPONSE", "message": "AI 응답을 생성하지 못했습니다."})
-        
-        # 메시지 히스토리 정리 (프론트엔드 전달용)
-        history = []
-        for m in final_state["messages"]:
-            if isinstance(m, SystemMessage): continue
-            if isinstance(m, ToolMessage): continue
-            if not m.content: continue # 빈 메시지(tool call 용) 제외
-            
-            role = "user" if isinstance(m, HumanMessage) else "assistant"
-            
-            # Content 처리 개선: 리스트 형태의 응답에서 텍스트만 추출 (Gemini 등 대응)
-            if isinstance(m.content, str):
-                content = m.content
-            elif isinstance(m.content, list):
-                texts = []
-                for part in m.content:
-                    if isinstance(part, dict) and part.get("type") == "text":
-                        texts.append(part.get("text", ""))
-                    elif isinstance(part, str):
-                        texts.append(part)
-                content = "".join(texts)
-            else:
-                content = str(m.content)
-            
-            # 텍스트 내용이 없으면 (예: 도구 호출용 메시지) 스킵
-            if not content.strip():
-                continue
-                
-            history.append(MessageDict(role=role, content=content))
-            
+        final_state = await app_graph.ainvoke(input_data, config=config)
+        history = _build_history(final_state["messages"])
         logger.info(f"✅ 채팅 처리 완료: thread_id={request.thread_id}")
         return history
 
+    except (HTTPException, LLMError):
+        raise
+    except DBError:
+        await _close_pending_tool_calls(config)
+        raise
     except Exception as e:
-        error_msg = str(e)
-        error_code, status_code = classify_error(error_msg)
-        logger.error(f"❌ 채팅 처리 중 예외 발생 [{error_code}]: {error_msg} (thread_id={request.thread_id})")
-        
-        # HTTP 에러 응답시 구체화된 에러코드와 메시지 전달
-        raise HTTPException(
-            status_code=status_code, 
-            detail={"error_code": error_code, "message": "서버 처리 중 문제가 발생했습니다. (내부 로그 확인)"}
-        )
+        logger.error(f"❌ 채팅 처리 중 예외 발생 [PROCESSING_ERROR]: {e} (thread_id={request.thread_id})")
+        raise HTTPException(status_code=500, detail={"error_code": "PROCESSING_ERROR", "message": ERROR_MESSAGE})
 
 if __name__ == "__main__":
     port = int(os.environ.get("PORT", 8000))
-    uvicorn.run("main:app", host="0.0.0.0", port=port, reload=True)
+    # 코드 변경 시 자동 재시작은 로컬 개발(DEV=1)에서만 사용
+    dev = os.environ.get("DEV") == "1"
+    # 대화 상태(MemorySaver 체크포인터)는 프로세스 메모리에 있어 워커 간 공유되지 않으므로 기본값은 단일 워커
+    # 워커를 늘리려면 공유 체크포인터를 쓰거나 thread_id 기준 고정 라우팅(sticky session)을 구성해야 함
+    workers = int(os.environ.get("WEB_CONCURRENCY", 1))
+    uvicorn.run("main:app", host="0.0.0.0", port=port, reload=dev, workers=None if dev else workers)
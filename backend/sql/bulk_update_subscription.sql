@@ -0,0 +1,27 @@
+-- change_subscription_plan 도구가 여러 달의 요금제 변경을 한 번의 요청(단일 트랜잭션)으로 반영하기 위한 함수
+-- Supabase SQL Editor에서 한 번 실행합니다.
+--
+-- p_rows: [{"billing_month": "2026-03", "subscription_info": {...}, "details": {...} | null}, ...]
+--   details가 null이면 기존 값을 유지합니다.
+-- 기존 행만 UPDATE하므로 (user_id, billing_month) unique 제약이나 INSERT 권한이 필요하지 않으며,
+-- SECURITY INVOKER(기본값)로 실행되어 호출자의 billing_history UPDATE 권한/RLS 정책이 그대로 적용됩니다.
+create or replace function public.bulk_update_subscription(p_user_id text, p_rows jsonb)
+returns integer
+language sql
+as $$
+    with updated as (
+        update public.billing_history as b
+        set subscription_info = r.subscription_info,
+            details = coalesce(r.details, b.details)
+        from jsonb_to_recordset(p_rows) as r(billing_month text, subscription_info jsonb, details jsonb)
+        where b.user_id = p_user_id
+          and b.billing_month = r.billing_month
+        returning 1
+    )
+    select count(*)::integer from updated;
+$$;
+
+grant execute on function public.bulk_update_subscription(text, jsonb) to anon, authenticated, service_role;
+
+-- PostgREST가 새 함수를 바로 인식하도록 스키마 캐시 갱신
+notify pgrst, 'reload schema';
@@ -0,0 +1,29 @@
+-- run_eval.py가 문항별 채점 결과를 저장하는 테이블
+-- Supabase SQL Editor에서 한 번 실행합니다.
+--
+-- 실행마다 run_id(uuid4 hex)를 부여하고 (run_id, question_id)를 키로 upsert하므로,
+-- 같은 실행을 재시도해도 문항별 행이 중복되지 않도록 두 컬럼을 묶어 unique 제약을 둡니다.
+-- groundedness ~ robustness는 원점수(0~1)에 지표 가중치를 곱한 축별 점수, score는 100점 만점 환산 총점,
+-- rouge_l은 정답과의 ROUGE-L F1(0~1, 진단용)입니다.
+create table if not exists public.eval_results (
+    id bigint generated always as identity primary key,
+    run_id text not null,
+    question_id text not null,
+    score double precision,
+    groundedness double precision,
+    evidenceability double precision,
+    clarity double precision,
+    atomicity double precision,
+    robustness double precision,
+    rouge_l double precision,
+    actual_output text,
+    reason_groundedness text,
+    reason_evidenceability text,
+    created_at timestamptz not null default now(),
+    constraint eval_results_run_id_question_id_key unique (run_id, question_id)
+);
+
+grant select, insert, update on table public.eval_results to anon, authenticated, service_role;
+
+-- PostgREST가 새 테이블을 바로 인식하도록 스키마 캐시 갱신
+notify pgrst, 'reload schema';
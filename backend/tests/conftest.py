@@ -0,0 +1,4 @@
+import os
+
+# backend.main은 import 시 Gemini 클라이언트를 만들므로 테스트용 더미 키 설정 (실제 API는 호출하지 않음)
+os.environ.setdefault("GOOGLE_API_KEY", "test-key")
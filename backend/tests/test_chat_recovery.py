@@ -0,0 +1,61 @@
+from fastapi.testclient import TestClient
+
+from backend import main
+from backend.main import AIMessage, ToolMessage, DBError
+
+class _FakeLLM:
+    """첫 호출은 도구 호출을, 이후 호출은 일반 답변을 반환하며 전달받은 메시지를 기록"""
+
+    def __init__(self):
+        self.calls = []
+
+    async def ainvoke(self, messages):
+        self.calls.append(messages)
+        if len(self.calls) == 1:
+            return AIMessage(content="", tool_calls=[
+                {"name": "fetch_billing_history", "args": {"user_id": "u1", "month": "2024-01"}, "id": "call-1"},
+                {"name": "calculate_billing", "args": {"plans": [{"plan": "라이트", "months": 1}]}, "id": "call-2"}
+            ])
+        return AIMessage(content="안녕하세요")
+
+class _FailingTool:
+    async def ainvoke(self, args):
+        raise DBError("연결 실패")
+
+def _assert_tool_calls_answered(messages):
+    # 모든 tool_call_id가 다음 AIMessage 전에 ToolMessage로 한 번씩 응답되어 있어야 함
+    pending = set()
+    answered = [m.tool_call_id for m in messages if isinstance(m, ToolMessage)]
+    assert len(answered) == len(set(answered))
+    for message in messages:
+        if isinstance(message, AIMessage):
+            assert not pending
+            pending = {tool_call["id"] for tool_call in message.tool_calls}
+        elif isinstance(message, ToolMessage):
+            pending.discard(message.tool_call_id)
+    assert not pending
+
+def _run_turns(monkeypatch, path, thread_id):
+    fake = _FakeLLM()
+    monkeypatch.setattr(main, "llm_with_tools", fake)
+    monkeypatch.setitem(main.tool_map, "fetch_billing_history", _FailingTool())
+    client = TestClient(main.app)
+
+    first = client.post(path, json={"message": "1월 요금 알려줘", "thread_id": thread_id})
+    second = client.post(path, json={"message": "다시 알려줘", "thread_id": thread_id})
+    return fake, first, second
+
+def test_blocking_turn_after_db_error(monkeypatch):
+    fake, first, second = _run_turns(monkeypatch, "/chat/blocking", "recovery-blocking")
+
+    assert first.status_code == 503
+    assert second.status_code == 200
+    assert second.json()[-1] == {"role": "assistant", "content": "안녕하세요"}
+    _assert_tool_calls_answered(fake.calls[-1])
+
+def test_stream_turn_after_db_error(monkeypatch):
+    fake, first, second = _run_turns(monkeypatch, "/chat", "recovery-stream")
+
+    assert "event: error" in first.text
+    assert "event: done" in second.text
+    _assert_tool_calls_answered(fake.calls[-1])
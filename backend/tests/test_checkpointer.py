@@ -0,0 +1,34 @@
+import asyncio
+
+from langgraph.graph import StateGraph, START, END
+
+from backend.main import State, BoundedMemorySaver, AIMessage, HumanMessage
+
+async def _echo_agent(state: State):
+    return {"messages": [AIMessage(content="ok")]}
+
+def _compile(saver: BoundedMemorySaver):
+    workflow = StateGraph(State)
+    workflow.add_node("agent", _echo_agent)
+    workflow.add_edge(START, "agent")
+    workflow.add_edge("agent", END)
+    return workflow.compile(checkpointer=saver)
+
+def test_eviction_removes_all_thread_entries():
+    saver = BoundedMemorySaver(max_threads=1)
+    graph = _compile(saver)
+
+    async def run():
+        for i in range(200):
+            config = {"configurable": {"thread_id": f"t{i}"}}
+            for _ in range(2):
+                await graph.ainvoke({"messages": [HumanMessage(content="hi")]}, config=config)
+
+    asyncio.run(run())
+
+    # 마지막 스레드만 남고, 축출된 스레드의 writes/blobs(get_tuple이 만든 빈 writes 항목 포함)는 모두 삭제되어야 함
+    assert list(saver.storage) == ["t199"]
+    assert {key[0] for key in saver.writes} <= {"t199"}
+    assert {key[0] for key in saver.blobs} == {"t199"}
+    assert len(saver.writes) <= sum(len(checkpoints) for checkpoints in saver.storage["t199"].values())
+    assert len(saver.blobs) == len(saver._blob_keys["t199"])
@@ -1,5 +1,4 @@
 import React, { useState, useEffect, useRef } from 'react';
-import axios from 'axios';
 import { Bot, User, Send, CreditCard, PieChart, Calculator, ArrowRightLeft, Info, X, Moon, Sun, Camera, Zap, Loader2, AlertCircle, HelpCircle } from 'lucide-react';
 import ReactMarkdown from 'react-markdown';
 import { motion, AnimatePresence } from 'framer-motion';
@@ -17,6 +16,17 @@ const getApiUrl = () => {
 const API_URL = getApiUrl();
 console.log('🔗 API_URL:', API_URL);
 
+// SSE 이벤트 블록("event: ...\ndata: ...")을 { event, data }로 변환
+const parseSseEvent = (raw) => {
+  let event = 'message';
+  let data = '';
+  for (const line of raw.split('\n')) {
+    if (line.startsWith('event:')) event = line.slice(6).trim();
+    else if (line.startsWith('data:')) data += line.slice(5).trim();
+  }
+  return { event, data: data ? JSON.parse(data) : null };
+};
+
 function App() {
   const [messages, setMessages] = useState([]);
   const [input, setInput] = useState('');
@@ -54,16 +64,48 @@ function App() {
     setInput('');
     setIsLoading(true);
 
+    // 이번 턴 이전까지의 대화 수 (서버는 이번 턴의 메시지만 반환)
+    const baseLength = messages.length;
+    // 스트리밍 중인 상담원 응답 (첫 토큰이 도착하면 말풍선 추가)
+    let streamed = '';
+
     try {
-      const response = await axios.post(`${API_URL}/chat`, {
-        message: input,
-        thread_id: threadId
+      const response = await fetch(`${API_URL}/chat`, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ message: input, thread_id: threadId })
       });
+      if (!response.ok || !response.body) throw new Error(`HTTP ${response.status}`);
 
-      setMessages(response.data);
+      const reader = response.body.pipeThrough(new TextDecoderStream()).getReader();
+      let buffer = '';
+      while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+
+        buffer += value;
+        const events = buffer.split('\n\n');
+        buffer = events.pop();
+        for (const raw of events) {
+          const { event, data } = parseSseEvent(raw);
+          if (event === 'done') {
+            // 토큰 단위로 그린 이번 턴을 서버가 정리한 메시지로 교체
+            setMessages((prev) => [...prev.slice(0, baseLength), ...data]);
+          } else if (event === 'error') {
+            throw new Error(data.error_code);
+          } else if (data?.delta) {
+            const isFirst = !streamed;
+            streamed += data.delta;
+            const text = streamed;
+            setMessages((prev) => isFirst
+              ? [...prev, { role: 'assistant', content: text }]
+              : [...prev.slice(0, -1), { role: 'assistant', content: text }]);
+          }
+        }
+      }
     } catch (error) {
       console.error('Error fetching chat:', error);
-      setMessages((prev) => [...prev, {
+      setMessages((prev) => [...(streamed ? prev.slice(0, -1) : prev), {
         role: 'assistant',
         content: '❌ 서버와 통신 중 오류가 발생했습니다. 잠시 후 다시 시도해 주세요.'
       }]);
@@ -294,7 +336,7 @@ function App() {
             </motion.div>
           ))}
 
-          {isLoading && (
+          {isLoading && messages[messages.length - 1]?.role !== 'assistant' && (
             <motion.div
               initial={{ opacity: 0 }}
               animate={{ opacity: 1 }}
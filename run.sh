@@ -12,5 +12,5 @@ npx concurrently \
   --names "SERVER,CLIENT" \
   --prefix-colors "blue.bold,green.bold" \
   --kill-others \
-  "uv run python backend/main.py" \
+  "DEV=1 uv run python backend/main.py" \
   "npm run dev --prefix frontend"